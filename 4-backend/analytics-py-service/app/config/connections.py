@@ -0,0 +1,31 @@
+import asyncio
+import logging
+
+from app.config.database import connect_to_mongo, warm_mongo_connection, close_mongo_connection
+from app.config.redis_config import connect_to_redis, warm_redis_connection, close_redis_connection
+
+logger = logging.getLogger(__name__)
+
+async def open_connections(use_redis: bool = True):
+    """
+    Open the shared Mongo client and Redis pool once per process and warm them,
+    so the first requests don't pay connection setup
+    """
+    await connect_to_mongo()
+    if use_redis:
+        await connect_to_redis()
+
+    warmups = [warm_mongo_connection()]
+    if use_redis:
+        warmups.append(warm_redis_connection())
+    results = await asyncio.gather(*warmups, return_exceptions=True)
+
+    if isinstance(results[0], Exception):
+        raise results[0]
+    # Redis only backs caching and queueing, so degrade instead of refusing to start
+    if use_redis and isinstance(results[1], Exception):
+        logger.warning(f"Redis warm-up failed, continuing without a warm pool: {results[1]}")
+
+async def close_connections():
+    await close_redis_connection()
+    await close_mongo_connection()
@@ -2,28 +2,61 @@ import os
 from motor.motor_asyncio import AsyncIOMotorClient
 from pymongo import MongoClient
 
+from app.services.metrics import mongo_command_listener
+
 MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
 DATABASE_NAME = os.getenv("DATABASE_NAME", "data_service")
 
+# Connection pool settings shared by the async and sync clients
+MONGO_CLIENT_OPTIONS = {
+    "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", 100)),
+    "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", 5)),
+    "maxIdleTimeMS": int(os.getenv("MONGO_MAX_IDLE_TIME_MS", 60000)),
+    "connectTimeoutMS": int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 5000)),
+    "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000)),
+    "waitQueueTimeoutMS": int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 5000)),
+    "event_listeners": [mongo_command_listener],
+}
+
 class MongoDB:
     client: AsyncIOMotorClient = None
     database = None
+    sync_client: MongoClient = None
 
 mongodb = MongoDB()
 
 async def connect_to_mongo():
-    mongodb.client = AsyncIOMotorClient(MONGODB_URL)
+    if mongodb.client is not None:
+        return
+    mongodb.client = AsyncIOMotorClient(MONGODB_URL, **MONGO_CLIENT_OPTIONS)
     mongodb.database = mongodb.client[DATABASE_NAME]
     print(f"Connected to MongoDB at {MONGODB_URL}")
 
+async def warm_mongo_connection():
+    """Round trip to the server so the pool is established before serving traffic"""
+    await mongodb.client.admin.command("ping")
+
 async def close_mongo_connection():
     if mongodb.client:
         mongodb.client.close()
+        mongodb.client = None
+        mongodb.database = None
         print("Disconnected from MongoDB")
+    if mongodb.sync_client:
+        mongodb.sync_client.close()
+        mongodb.sync_client = None
 
 def get_database():
     return mongodb.database
 
+async def get_async_database():
+    """Shared Motor database, connecting on first use outside the app lifespan"""
+    if mongodb.database is None:
+        await connect_to_mongo()
+    return mongodb.database
+
 def get_sync_database():
-    client = MongoClient(MONGODB_URL)
-    return client[DATABASE_NAME]
\ No newline at end of file
+    # One pooled client per process instead of a new client (and monitor threads) per call
+    if mongodb.sync_client is None:
+        mongodb.sync_client = MongoClient(MONGODB_URL, **MONGO_CLIENT_OPTIONS)
+    return mongodb.sync_client[DATABASE_NAME]
\ No newline at end of file
@@ -0,0 +1,140 @@
+import os
+from typing import Dict, List
+import logging
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from app.services.archive import archiving_enabled
+from app.services.rollups import ROLLUPS_COLLECTION
+from app.services.event_store import (
+    EVENTS_TIMESERIES_COLLECTION, ensure_timeseries_collection, timeseries_storage
+)
+
+logger = logging.getLogger(__name__)
+
+# Optional retention: when set, a TTL index on timestamp replaces cleanup_old_events
+EVENTS_TTL_DAYS = int(os.getenv("EVENTS_TTL_DAYS", 0))
+
+REQUIRED_INDEXES: Dict[str, List[IndexModel]] = {
+    "events": [
+        # Per-user listings, exports and time-window aggregations
+        # _id breaks timestamp ties so keyset pagination stays an index scan
+        IndexModel(
+            [("user_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+            name="user_id_timestamp_id"
+        ),
+        IndexModel(
+            [("user_id", ASCENDING), ("event_type", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+            name="user_id_event_type_timestamp_id"
+        ),
+        # Only the small unprocessed backlog is indexed
+        IndexModel(
+            [("processed", ASCENDING)],
+            name="unprocessed",
+            partialFilterExpression={"processed": False}
+        ),
+        # Processed events not yet counted in the rollups, for reconcile_rollups
+        IndexModel(
+            [("rollup_pending", ASCENDING)],
+            name="rollup_pending",
+            partialFilterExpression={"rollup_pending": True}
+        ),
+    ],
+    ROLLUPS_COLLECTION: [
+        IndexModel(
+            [("user_id", ASCENDING), ("granularity", ASCENDING), ("bucket", ASCENDING)],
+            name="user_id_granularity_bucket"
+        ),
+    ],
+}
+
+if timeseries_storage():
+    # Secondary indexes on the bucketed metadata; created after the collection itself
+    REQUIRED_INDEXES[EVENTS_TIMESERIES_COLLECTION] = [
+        IndexModel(
+            [("meta.user_id", ASCENDING), ("timestamp", DESCENDING)],
+            name="meta_user_id_timestamp"
+        ),
+        IndexModel(
+            [("meta.user_id", ASCENDING), ("meta.event_type", ASCENDING), ("timestamp", DESCENDING)],
+            name="meta_user_id_event_type_timestamp"
+        ),
+    ]
+
+if archiving_enabled():
+    # Walks expired events oldest first for app.tasks.archive_events
+    REQUIRED_INDEXES["events"].append(
+        IndexModel([("timestamp", ASCENDING), ("_id", ASCENDING)], name="timestamp_id")
+    )
+
+def _key_of(index_model: IndexModel) -> tuple:
+    return tuple(index_model.document["key"].items())
+
+async def _ensure_events_ttl(db):
+    """Add (or retune) the TTL on events.timestamp without clashing with an existing index"""
+    expire_after = EVENTS_TTL_DAYS * 86400
+    existing = await db.events.index_information()
+    for name, info in existing.items():
+        if info.get("key") == [("timestamp", 1)]:
+            if info.get("expireAfterSeconds") != expire_after:
+                await db.command({
+                    "collMod": "events",
+                    "index": {"name": name, "expireAfterSeconds": expire_after}
+                })
+                logger.info(f"Set TTL of {EVENTS_TTL_DAYS} days on existing index {name}")
+            return
+    await db.events.create_index([("timestamp", ASCENDING)], name="timestamp_ttl", expireAfterSeconds=expire_after)
+    logger.info(f"Created TTL index on events.timestamp ({EVENTS_TTL_DAYS} days)")
+
+async def ensure_indexes(db):
+    """
+    Create the indexes the service relies on; safe to run on every startup
+    """
+    if timeseries_storage():
+        # Must exist before create_index would implicitly make a regular collection
+        await ensure_timeseries_collection(db)
+
+    for collection, indexes in REQUIRED_INDEXES.items():
+        for index_model in indexes:
+            try:
+                await db[collection].create_indexes([index_model])
+            except OperationFailure as e:
+                logger.error(f"Failed to ensure index {index_model.document['name']} on {collection}: {e}")
+
+    if EVENTS_TTL_DAYS:
+        try:
+            await _ensure_events_ttl(db)
+        except OperationFailure as e:
+            logger.error(f"Failed to ensure TTL index on events: {e}")
+
+    logger.info("Ensured MongoDB indexes")
+
+async def index_report(db) -> dict:
+    """
+    Compare declared indexes with what exists and how often each one is used
+    """
+    report = {}
+    for collection, indexes in REQUIRED_INDEXES.items():
+        stats = await db[collection].aggregate([{"$indexStats": {}}]).to_list(length=None)
+        existing_keys = {tuple(stat["key"].items()): stat for stat in stats}
+
+        report[collection] = {
+            "missing": [
+                index_model.document["name"]
+                for index_model in indexes
+                if _key_of(index_model) not in existing_keys
+            ],
+            "unused": [
+                stat["name"]
+                for stat in stats
+                if stat["name"] != "_id_" and stat.get("accesses", {}).get("ops", 0) == 0
+            ],
+            "usage": {
+                stat["name"]: {
+                    "ops": stat.get("accesses", {}).get("ops", 0),
+                    "since": stat.get("accesses", {}).get("since")
+                }
+                for stat in stats
+            }
+        }
+    return report
@@ -2,20 +2,44 @@ import os
 import redis.asyncio as redis
 from redis.asyncio import Redis
 
+from app.services.metrics import InstrumentedRedis
+
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", 0)) or None
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", 5))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30))
 
 class RedisClient:
     client: Redis = None
+    pool: redis.ConnectionPool = None
 
 redis_client = RedisClient()
 
 async def connect_to_redis():
-    redis_client.client = redis.from_url(REDIS_URL, decode_responses=True)
+    if redis_client.client is not None:
+        return
+    # Blocking reads (XREADGROUP, pub/sub) need no socket timeout, so it is opt-in
+    redis_client.pool = redis.ConnectionPool.from_url(
+        REDIS_URL,
+        decode_responses=True,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+        health_check_interval=REDIS_HEALTH_CHECK_INTERVAL
+    )
+    redis_client.client = InstrumentedRedis(connection_pool=redis_client.pool)
     print(f"Connected to Redis at {REDIS_URL}")
 
+async def warm_redis_connection():
+    await redis_client.client.ping()
+
 async def close_redis_connection():
     if redis_client.client:
         await redis_client.client.close()
+        await redis_client.pool.disconnect()
+        redis_client.client = None
+        redis_client.pool = None
         print("Disconnected from Redis")
 
 def get_redis_client():
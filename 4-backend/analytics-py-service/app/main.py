@@ -1,27 +1,62 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+import asyncio
 import os
 from dotenv import load_dotenv
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+# Before the app imports: their module-level settings read the environment
+load_dotenv()
 
 from app.config.database import get_database
+from app.config.connections import open_connections, close_connections
+from app.config.indexes import ensure_indexes
 from app.config.redis_config import get_redis_client
 from app.routes import data, analytics
 from app.middleware.trust_kong import trust_kong_middleware
-from app.services.grpc_client import GRPCClient
+from app.middleware.metrics import metrics_middleware
+from app.services.grpc_client import grpc_client
+from app.services.analytics_engine import shutdown_engine
+from app.services.event_queue import DATA_EVENTS_STREAM, DATA_EVENTS_GROUP
+from app.services.ingest_buffer import buffered_ingestion, ingest_buffer
+from app.services.live_updates import live_hub
+from app.services.metrics import monitor_event_loop, monitor_event_queue
 
-load_dotenv()
-
-# Initialize gRPC client
-grpc_client = GRPCClient()
+ENSURE_INDEXES_ON_STARTUP = os.getenv("ENSURE_INDEXES_ON_STARTUP", "true").lower() == "true"
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # Open and warm the shared Mongo client and Redis pool before serving
+    await open_connections()
+    # Make sure the indexes every events query relies on exist
+    if ENSURE_INDEXES_ON_STARTUP:
+        await ensure_indexes(get_database())
     # Connect to business service via gRPC
-    grpc_client.connect()
+    await grpc_client.connect()
+    # Write-behind ingestion flusher
+    if buffered_ingestion():
+        ingest_buffer.start(get_database(), get_redis_client())
+    # One pub/sub subscription per process feeds every SSE client
+    if get_redis_client():
+        live_hub.start(get_redis_client())
+    # Background samplers for event-loop blocking and queue depth/lag
+    monitors = [asyncio.create_task(monitor_event_loop())]
+    if get_redis_client():
+        monitors.append(asyncio.create_task(
+            monitor_event_queue(get_redis_client(), DATA_EVENTS_STREAM, DATA_EVENTS_GROUP)
+        ))
     yield
+    # Commit buffered events while Mongo and Redis are still open
+    await ingest_buffer.stop()
+    await live_hub.stop()
+    for monitor in monitors:
+        monitor.cancel()
     # Close gRPC connection
-    grpc_client.close()
+    await grpc_client.close()
+    # Stop the analytics engine's worker processes
+    shutdown_engine()
+    await close_connections()
 
 app = FastAPI(
     title="Campus Analytics Service",
@@ -32,6 +67,7 @@ app = FastAPI(
 
 # Trust Kong middleware - no authentication needed
 app.middleware("http")(trust_kong_middleware)
+app.middleware("http")(metrics_middleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -48,6 +84,10 @@ async def health_check():
         "service": "campus-analytics"
     }
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 app.include_router(data.router, prefix="/api/data", tags=["data"])
 app.include_router(analytics.router, prefix="/api/analytics", tags=["analytics"])
 
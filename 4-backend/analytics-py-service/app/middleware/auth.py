@@ -1,29 +1,82 @@
+import hashlib
 import os
-from fastapi import HTTPException, Security
+import time
+from functools import lru_cache
+from typing import Optional, Tuple
+from fastapi import HTTPException, Request, Security
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
 from pydantic import BaseModel
 
-security = HTTPBearer()
+from app.middleware.trust_kong import get_current_user
+from app.services.ttl_cache import TTLCache
+
+JWT_ALGORITHMS = ["HS256"]
+JWT_CACHE_MAXSIZE = int(os.getenv("JWT_CACHE_MAXSIZE", 10000))
+# Upper bound on how long a verified token is reused, also for tokens without exp
+JWT_CACHE_TTL = int(os.getenv("JWT_CACHE_TTL", 300))
+
+# "jwt" verifies the bearer token on every request (cached); "kong" trusts the
+# identity headers Kong forwards and only verifies tokens on requests without
+# them. Enable "kong" only where the service is unreachable except through Kong
+AUTH_MODE = os.getenv("AUTH_MODE", "jwt")
+
+security = HTTPBearer(auto_error=False)
 
 class TokenData(BaseModel):
     user_id: str = None
     username: str = None
 
-def verify_jwt_token(credentials: HTTPAuthorizationCredentials = Security(security)):
-    token = credentials.credentials
-    
+token_cache = TTLCache(maxsize=JWT_CACHE_MAXSIZE, ttl=JWT_CACHE_TTL)
+
+@lru_cache(maxsize=1)
+def get_jwt_secret() -> str:
+    """
+    Read on first use rather than at import, so a JWT_SECRET from .env loaded by
+    the entrypoint is honoured; rotating the secret needs a restart
+    """
+    return os.getenv("JWT_SECRET", "jwt-secret")
+
+def decode_token(token: str) -> Tuple[TokenData, Optional[int]]:
+    """Full signature and claims check; returns the identity and the exp claim"""
     try:
-        jwt_secret = os.getenv("JWT_SECRET", "jwt-secret")
-        payload = jwt.decode(token, jwt_secret, algorithms=["HS256"])
-        
-        user_id: str = payload.get("userId")
-        username: str = payload.get("username")
-        
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        
-        return TokenData(user_id=user_id, username=username)
-    
+        payload = jwt.decode(token, get_jwt_secret(), algorithms=JWT_ALGORITHMS)
     except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
\ No newline at end of file
+        raise HTTPException(status_code=401, detail="Invalid token")
+    
+    user_id: str = payload.get("userId")
+    username: str = payload.get("username")
+    
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    
+    return TokenData(user_id=user_id, username=username), payload.get("exp")
+
+def verify_token(token: str) -> TokenData:
+    """
+    Verified-token cache keyed by the token hash; an entry never outlives the
+    token's exp, so expired tokens fall through to a full decode and fail there
+    """
+    key = hashlib.sha256(token.encode()).hexdigest()
+    cached = token_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    token_data, exp = decode_token(token)
+    ttl = JWT_CACHE_TTL
+    if isinstance(exp, (int, float)):
+        ttl = min(ttl, exp - time.time())
+    if ttl > 0:
+        token_cache.set(key, token_data, ttl=ttl)
+    return token_data
+
+def verify_jwt_token(request: Request, credentials: HTTPAuthorizationCredentials = Security(security)):
+    if AUTH_MODE == "kong":
+        user = get_current_user(request)
+        if user and user.is_authenticated:
+            return TokenData(user_id=user.id, username=user.name)
+    
+    if credentials is None:
+        raise HTTPException(status_code=403, detail="Not authenticated")
+    
+    return verify_token(credentials.credentials)
\ No newline at end of file
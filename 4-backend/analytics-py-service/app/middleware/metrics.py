@@ -0,0 +1,25 @@
+import time
+from fastapi import Request
+
+from app.services.metrics import HTTP_REQUEST_DURATION
+
+def _route_template(request: Request) -> str:
+    # The matched template keeps label cardinality bounded; raw paths carry ids
+    route = request.scope.get("route")
+    return getattr(route, "path", "unmatched")
+
+async def metrics_middleware(request: Request, call_next):
+    """
+    请求耗时中间件
+    按方法、路由模板和状态码记录HTTP请求耗时
+    """
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        HTTP_REQUEST_DURATION.labels(
+            request.method, _route_template(request), str(status)
+        ).observe(time.perf_counter() - start)
\ No newline at end of file
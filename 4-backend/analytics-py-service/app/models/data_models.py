@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from datetime import datetime
 from bson import ObjectId
 
@@ -37,12 +37,21 @@ class CreateDataEventRequest(BaseModel):
     event_data: Dict[str, Any]
     metadata: Optional[Dict[str, Any]] = None
 
+class BatchCreateDataEventsRequest(BaseModel):
+    events: List[CreateDataEventRequest] = Field(..., min_length=1, max_length=1000)
+
 class AnalyticsQuery(BaseModel):
     start_date: Optional[datetime] = None
     end_date: Optional[datetime] = None
     event_types: Optional[list] = None
-    aggregation: str = "count"  # count, sum, avg
-    group_by: Optional[str] = None
+    aggregation: str = "count"  # count, sum, avg, min, max, percentile
+    group_by: Optional[str] = None  # event_type, processed, processed_data.category
+    bucket: Optional[str] = None  # hour, day, week
+    percentile: Optional[float] = Field(None, ge=0, le=100)
+    mode: str = "aggregate"  # aggregate, percentiles, histogram, rolling, stats
+    percentiles: Optional[List[float]] = None
+    bins: Optional[int] = Field(None, ge=1, le=1000)
+    window: Optional[int] = Field(None, ge=1, le=365)
 
 class AnalyticsResult(BaseModel):
     total_events: int
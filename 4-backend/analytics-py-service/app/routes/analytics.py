@@ -1,161 +1,225 @@
-from fastapi import APIRouter, Depends, HTTPException
-from datetime import datetime, timedelta
-from typing import Dict, Any
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from datetime import datetime
+from typing import Dict, Any, List, Optional
 import asyncio
+import os
 
 from app.config.database import get_database
+from app.config.redis_config import get_redis_client
 from app.models.data_models import AnalyticsQuery, AnalyticsResult
 from app.middleware.auth import verify_jwt_token, TokenData
+from app.middleware.trust_kong import UserContext, require_role
+from app.services.rollups import ROLLUP_DASHBOARD_SECTIONS, get_rollup_dashboard
+from app.services.cache import analytics_cache
+from app.services.analytics_engine import ENGINE_MODES, run_engine_query, validate_engine_query
+from app.services.query_planner import QueryPlanError, execute_plan, plan_query
+from app.services.query_budget import BudgetExceeded, cancel_on_disconnect, get_budget
+from app.services.fast_json import BSONJSONResponse
+from app.services.export import MEDIA_TYPES, export_cursor, stream_events, with_archived
+from app.services.archive import archiving_enabled, load_archived_events
+from app.services.event_store import events_collection, storage_projection, storage_query
+from app.services.live_updates import live_hub
+from app.services.cardinality import (
+    ALL_EVENTS, GRANULARITIES, distinct_users, event_rates, max_periods, period_count
+)
 
 router = APIRouter()
 
+# Kong roles allowed to read the cross-user admin analytics
+ANALYTICS_ADMIN_ROLES = os.getenv("ANALYTICS_ADMIN_ROLES", "admin").split(",")
+
+DASHBOARD_SECTIONS = ROLLUP_DASHBOARD_SECTIONS + ("recent_events",)
+
+def _parse_sections(sections: Optional[str]) -> List[str]:
+    if not sections:
+        return list(DASHBOARD_SECTIONS)
+    requested = [section.strip() for section in sections.split(",") if section.strip()]
+    unknown = [section for section in requested if section not in DASHBOARD_SECTIONS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown dashboard sections: {unknown}. Available: {list(DASHBOARD_SECTIONS)}"
+        )
+    return sorted(set(requested), key=DASHBOARD_SECTIONS.index)
+
+async def _recent_events(db, user_id: str, limit: int = 10) -> list:
+    budget = get_budget("dashboard")
+    cursor = budget.find(events_collection(db).find(
+        storage_query({"user_id": user_id}),
+        storage_projection({"event_type": 1, "timestamp": 1, "event_data": 1})
+    ).sort("timestamp", -1).limit(limit))
+    return await budget.to_list(cursor, length=limit)
+
+async def _compute_dashboard(db, user_id: str, sections: List[str]) -> dict:
+    # Rollup sections share one $facet; recent events hit the raw collection
+    # and run concurrently with it
+    rollup_sections = [section for section in sections if section in ROLLUP_DASHBOARD_SECTIONS]
+    lookups = []
+    if rollup_sections:
+        lookups.append(get_rollup_dashboard(db, user_id, sections=rollup_sections, budget=get_budget("dashboard")))
+    if "recent_events" in sections:
+        lookups.append(_recent_events(db, user_id))
+    
+    results = await asyncio.gather(*lookups)
+    
+    data = {}
+    if rollup_sections:
+        data.update(results[0])
+    if "recent_events" in sections:
+        data["recent_events"] = results[-1]
+    return data
+
 @router.get("/dashboard", response_model=dict)
 async def get_analytics_dashboard(
+    request: Request,
+    sections: Optional[str] = None,
     db=Depends(get_database),
+    redis_client=Depends(get_redis_client),
     current_user: TokenData = Depends(verify_jwt_token)
 ):
+    requested_sections = _parse_sections(sections)
+    
     try:
-        user_query = {"user_id": current_user.user_id}
-        
-        total_events = await db.events.count_documents(user_query)
-        
-        event_types_pipeline = [
-            {"$match": user_query},
-            {"$group": {"_id": "$event_type", "count": {"$sum": 1}}},
-            {"$sort": {"count": -1}}
-        ]
-        event_types_cursor = db.events.aggregate(event_types_pipeline)
-        event_types = await event_types_cursor.to_list(length=None)
+        data = await cancel_on_disconnect(request, analytics_cache.get_or_compute(
+            redis_client, "dashboard", current_user.user_id, {"sections": requested_sections},
+            lambda: _compute_dashboard(db, current_user.user_id, requested_sections)
+        ), get_budget("dashboard"))
         
-        event_breakdown = {item["_id"]: item["count"] for item in event_types}
-        
-        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-        week_ago = today - timedelta(days=7)
-        
-        daily_pipeline = [
-            {"$match": {
-                "user_id": current_user.user_id,
-                "timestamp": {"$gte": week_ago}
-            }},
-            {"$group": {
-                "_id": {
-                    "$dateToString": {
-                        "format": "%Y-%m-%d",
-                        "date": "$timestamp"
-                    }
-                },
-                "count": {"$sum": 1}
-            }},
-            {"$sort": {"_id": 1}}
-        ]
-        daily_cursor = db.events.aggregate(daily_pipeline)
-        daily_stats = await daily_cursor.to_list(length=None)
-        
-        time_series = {item["_id"]: item["count"] for item in daily_stats}
-        
-        recent_events = await db.events.find(
-            user_query,
-            {"event_type": 1, "timestamp": 1, "event_data": 1}
-        ).sort("timestamp", -1).limit(10).to_list(length=10)
-        
-        for event in recent_events:
-            event["_id"] = str(event["_id"])
-        
-        return {
+        return BSONJSONResponse({
             "success": True,
-            "data": {
-                "total_events": total_events,
-                "event_breakdown": event_breakdown,
-                "time_series": time_series,
-                "recent_events": recent_events
-            }
-        }
+            "data": data
+        })
         
+    except BudgetExceeded as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch analytics: {str(e)}")
 
+async def _run_analytics_query(db, redis_client, user_id: str, query: AnalyticsQuery) -> dict:
+    if query.mode in ENGINE_MODES:
+        data = await run_engine_query(db, redis_client, user_id, query)
+    else:
+        plan = plan_query(user_id, query)
+        data = await execute_plan(db, plan, budget=get_budget("query"))
+    data["query_params"] = query.dict()
+    return data
+
 @router.post("/query", response_model=dict)
 async def query_analytics(
+    request: Request,
     query: AnalyticsQuery,
     db=Depends(get_database),
+    redis_client=Depends(get_redis_client),
     current_user: TokenData = Depends(verify_jwt_token)
 ):
     try:
-        match_criteria = {"user_id": current_user.user_id}
-        
-        if query.start_date or query.end_date:
-            timestamp_filter = {}
-            if query.start_date:
-                timestamp_filter["$gte"] = query.start_date
-            if query.end_date:
-                timestamp_filter["$lte"] = query.end_date
-            match_criteria["timestamp"] = timestamp_filter
-        
-        if query.event_types:
-            match_criteria["event_type"] = {"$in": query.event_types}
-        
-        pipeline = [{"$match": match_criteria}]
-        
-        if query.group_by:
-            group_stage = {
-                "_id": f"${query.group_by}",
-                "count": {"$sum": 1}
-            }
-            
-            if query.aggregation == "sum" and "event_data.value" in match_criteria:
-                group_stage["total"] = {"$sum": "$event_data.value"}
-            elif query.aggregation == "avg" and "event_data.value" in match_criteria:
-                group_stage["average"] = {"$avg": "$event_data.value"}
-            
-            pipeline.append({"$group": group_stage})
-            pipeline.append({"$sort": {"count": -1}})
-        
-        cursor = db.events.aggregate(pipeline)
-        results = await cursor.to_list(length=None)
-        
-        total_events = await db.events.count_documents(match_criteria)
+        # Validate up front so bad fields are a 400, not a 500
+        if query.mode in ENGINE_MODES:
+            validate_engine_query(query)
+        else:
+            plan_query(current_user.user_id, query)
+    except QueryPlanError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        data = await cancel_on_disconnect(request, analytics_cache.get_or_compute(
+            redis_client, "query", current_user.user_id, query.dict(),
+            lambda: _run_analytics_query(db, redis_client, current_user.user_id, query)
+        ), get_budget("query"))
         
-        return {
+        return BSONJSONResponse({
             "success": True,
-            "data": {
-                "total_events": total_events,
-                "results": results,
-                "query_params": query.dict()
-            }
-        }
+            "data": data
+        })
         
+    except BudgetExceeded as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to execute analytics query: {str(e)}")
 
+@router.get("/stream")
+async def stream_live_updates(
+    current_user: TokenData = Depends(verify_jwt_token)
+):
+    """Server-Sent Events: per-type counts, sliding-window rates and recent events as they are written"""
+    if not live_hub.running:
+        raise HTTPException(status_code=503, detail="Live updates unavailable")
+    
+    client = await live_hub.connect(current_user.user_id)
+    if client is None:
+        raise HTTPException(status_code=503, detail="Too many live connections", headers={"Retry-After": "30"})
+    
+    return StreamingResponse(
+        live_hub.stream(client),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(live_hub.disconnect, client)
+    )
+
 @router.get("/export", response_model=dict)
 async def export_data(
+    request: Request,
     format: str = "json",
     start_date: str = None,
     end_date: str = None,
+    stream: bool = False,
+    gzip: bool = False,
+    limit: Optional[int] = Query(None, ge=1),
     db=Depends(get_database),
     current_user: TokenData = Depends(verify_jwt_token)
 ):
     try:
         query = {"user_id": current_user.user_id}
+        start = datetime.fromisoformat(start_date) if start_date else None
+        end = datetime.fromisoformat(end_date) if end_date else None
         
-        if start_date:
-            query["timestamp"] = {"$gte": datetime.fromisoformat(start_date)}
-        if end_date:
+        if start:
+            query["timestamp"] = {"$gte": start}
+        if end:
             if "timestamp" not in query:
                 query["timestamp"] = {}
-            query["timestamp"]["$lte"] = datetime.fromisoformat(end_date)
+            query["timestamp"]["$lte"] = end
         
-        cursor = db.events.find(query).sort("timestamp", -1)
-        events = await cursor.to_list(length=None)
+        budget = get_budget("export")
+        if stream:
+            # Streaming mode: rows are encoded batch by batch straight from the cursor.
+            # maxTimeMS bounds the cursor's server time across getMores; a timeout
+            # after the headers went out aborts the response, truncating the file
+            fmt = "csv" if format.lower() == "csv" else "ndjson"
+            # gzip=true delivers a .gz file, not a transfer encoding: with
+            # Content-Encoding clients would decode it and save plain text as .gz
+            headers = {"Content-Disposition": f'attachment; filename="events.{fmt}{".gz" if gzip else ""}"'}
+            cursor = budget.find(export_cursor(db, query, limit))
+            return StreamingResponse(
+                stream_events(
+                    with_archived(cursor, current_user.user_id, start, end, limit),
+                    fmt, compress=gzip
+                ),
+                media_type=MEDIA_TYPES["gzip"] if gzip else MEDIA_TYPES[fmt],
+                headers=headers
+            )
         
-        for event in events:
-            event["_id"] = str(event["_id"])
-            event["timestamp"] = event["timestamp"].isoformat()
+        cursor = budget.find(
+            events_collection(db).find(storage_query(query), storage_projection()).sort("timestamp", -1)
+        )
+        events = await cancel_on_disconnect(request, budget.to_list(cursor), budget)
+        # Ranges reaching past the retention window continue in the archive
+        if archiving_enabled():
+            events += await load_archived_events(
+                current_user.user_id, start, end, budget.max_results + 1 - len(events)
+            )
+            budget.check_size(len(events))
         
         if format.lower() == "csv":
             import csv
             import io
             
+            for event in events:
+                event["_id"] = str(event["_id"])
+                event["timestamp"] = event["timestamp"].isoformat()
+            
             output = io.StringIO()
             if events:
                 fieldnames = list(events[0].keys())
@@ -171,12 +235,73 @@ async def export_data(
                 "count": len(events)
             }
         
-        return {
+        return BSONJSONResponse({
             "success": True,
             "data": events,
             "format": "json",
             "count": len(events)
-        }
+        })
         
+    except BudgetExceeded as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to export data: {str(e)}")
+
+def require_admin(request: Request) -> UserContext:
+    return require_role(request, ANALYTICS_ADMIN_ROLES)
+
+def _check_granularity(redis_client, granularity: str):
+    if not redis_client:
+        raise HTTPException(status_code=503, detail="Redis unavailable")
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"Unsupported granularity '{granularity}'. Available: {list(GRANULARITIES)}")
+
+def _check_periods(granularity: str, periods: int):
+    if periods < 1 or periods > max_periods(granularity):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Range must cover 1 to {max_periods(granularity)} {granularity} periods"
+        )
+
+@router.get("/admin/unique-users", response_model=dict)
+async def get_unique_users(
+    event_type: str = ALL_EVENTS,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    granularity: str = "day",
+    redis_client=Depends(get_redis_client),
+    admin: UserContext = Depends(require_admin)
+):
+    """Approximate distinct users for an event type, per period and over the range (default: today)"""
+    _check_granularity(redis_client, granularity)
+    end = end_date or datetime.utcnow()
+    start = start_date or end
+    _check_periods(granularity, period_count(start, end, granularity))
+    
+    try:
+        return {
+            "success": True,
+            "data": await distinct_users(redis_client, event_type, start, end, granularity)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to count unique users: {str(e)}")
+
+@router.get("/admin/event-rates", response_model=dict)
+async def get_event_rates(
+    event_type: str = ALL_EVENTS,
+    granularity: str = "hour",
+    periods: int = 24,
+    redis_client=Depends(get_redis_client),
+    admin: UserContext = Depends(require_admin)
+):
+    """Event counts over a sliding window of the last `periods` hours or days"""
+    _check_granularity(redis_client, granularity)
+    _check_periods(granularity, periods)
+    
+    try:
+        return {
+            "success": True,
+            "data": await event_rates(redis_client, event_type, granularity, periods)
+        }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to export data: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Failed to read event rates: {str(e)}")
\ No newline at end of file
@@ -1,13 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from datetime import datetime
-from typing import List
-import json
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Response
+from typing import List, Optional
+from pymongo.errors import BulkWriteError, OperationFailure
 
 from app.config.database import get_database
 from app.config.redis_config import get_redis_client
-from app.models.data_models import DataEvent, CreateDataEventRequest
+from app.models.data_models import DataEvent, CreateDataEventRequest, BatchCreateDataEventsRequest
 from app.middleware.auth import verify_jwt_token, TokenData
-from app.tasks.data_processing import process_data_event
+from app.tasks.data_processing import insert_events, process_data_events
+from app.services.event_queue import enqueue_events, process_inline
+from app.services.ingest_buffer import (
+    INGEST_RETRY_AFTER_SECONDS, BufferFull, buffered_ingestion, ingest_buffer
+)
+from app.services.rollups import apply_rollups
+from app.services.event_store import (
+    event_id_filter, events_collection, storage_projection, storage_query, timeseries_storage
+)
+from app.services.cache import bump_generation
+from app.services.cardinality import record_events
+from app.services.live_updates import publish_events
+from app.services.fast_json import BSONJSONResponse
+from app.services.query_budget import BudgetExceeded, get_budget
+from app.services.pagination import EVENTS_SORT, InvalidCursor, after_cursor, encode_cursor
 
 router = APIRouter()
 
@@ -15,6 +28,7 @@ router = APIRouter()
 async def create_data_event(
     event_request: CreateDataEventRequest,
     background_tasks: BackgroundTasks,
+    response: Response,
     db=Depends(get_database),
     redis_client=Depends(get_redis_client),
     current_user: TokenData = Depends(verify_jwt_token)
@@ -30,59 +44,164 @@ async def create_data_event(
         event_dict = event.dict(by_alias=True)
         event_dict["_id"] = str(event_dict["_id"])
         
-        result = await db.events.insert_one(event_dict)
+        if buffered_ingestion():
+            # Write-behind: the flusher group-commits and does the follow-up work
+            ingest_buffer.add(event_dict)
+            response.status_code = 202
+            return {
+                "success": True,
+                "message": "Event accepted",
+                "event_id": event_dict["_id"]
+            }
         
-        background_tasks.add_task(process_data_event, str(result.inserted_id))
+        await insert_events(db, [event_dict])
         
-        if redis_client:
-            await redis_client.lpush(
-                "data_events_queue",
-                json.dumps({
-                    "event_id": str(result.inserted_id),
-                    "event_type": event_request.event_type,
-                    "user_id": current_user.user_id,
-                    "timestamp": datetime.utcnow().isoformat()
-                })
-            )
+        # Time-series storage classifies on write, so there is nothing to queue
+        if not timeseries_storage():
+            if process_inline():
+                background_tasks.add_task(process_data_events, [event_dict["_id"]])
+            
+            await enqueue_events(redis_client, [event_dict])
+        await bump_generation(redis_client, [current_user.user_id])
+        await record_events(redis_client, [event_dict])
+        await publish_events(redis_client, [event_dict])
         
         return {
             "success": True,
             "message": "Event recorded successfully",
-            "event_id": str(result.inserted_id)
+            "event_id": event_dict["_id"]
         }
         
+    except BufferFull as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(INGEST_RETRY_AFTER_SECONDS)}
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to record event: {str(e)}")
 
+@router.post("/events:batch", response_model=dict)
+async def create_data_events_batch(
+    batch_request: BatchCreateDataEventsRequest,
+    background_tasks: BackgroundTasks,
+    db=Depends(get_database),
+    redis_client=Depends(get_redis_client),
+    current_user: TokenData = Depends(verify_jwt_token)
+):
+    try:
+        event_dicts = []
+        for event_request in batch_request.events:
+            event = DataEvent(
+                event_type=event_request.event_type,
+                event_data=event_request.event_data,
+                user_id=current_user.user_id,
+                metadata=event_request.metadata
+            )
+            event_dict = event.dict(by_alias=True)
+            event_dict["_id"] = str(event_dict["_id"])
+            event_dicts.append(event_dict)
+        
+        # Unordered so one bad document does not abort the rest of the batch
+        write_errors = {}
+        try:
+            await insert_events(db, event_dicts)
+        except BulkWriteError as bwe:
+            for error in bwe.details.get("writeErrors", []):
+                write_errors[error["index"]] = error.get("errmsg", "write error")
+        
+        results = []
+        inserted = []
+        for index, event_dict in enumerate(event_dicts):
+            if index in write_errors:
+                results.append({
+                    "index": index,
+                    "success": False,
+                    "error": write_errors[index]
+                })
+            else:
+                inserted.append(event_dict)
+                results.append({
+                    "index": index,
+                    "success": True,
+                    "event_id": event_dict["_id"]
+                })
+        
+        if inserted:
+            if not timeseries_storage():
+                if process_inline():
+                    inserted_ids = [event_dict["_id"] for event_dict in inserted]
+                    background_tasks.add_task(process_data_events, inserted_ids)
+                
+                await enqueue_events(redis_client, inserted)
+            await bump_generation(redis_client, [current_user.user_id])
+            await record_events(redis_client, inserted)
+            await publish_events(redis_client, inserted)
+        
+        return {
+            "success": not write_errors,
+            "message": f"Recorded {len(inserted)} of {len(event_dicts)} events",
+            "inserted_count": len(inserted),
+            "failed_count": len(write_errors),
+            "results": results
+        }
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to record events: {str(e)}")
+
 @router.get("/events", response_model=dict)
 async def get_user_events(
     skip: int = 0,
     limit: int = 10,
     event_type: str = None,
+    cursor: Optional[str] = None,
+    include_total: Optional[bool] = None,
     db=Depends(get_database),
     current_user: TokenData = Depends(verify_jwt_token)
 ):
+    query = {"user_id": current_user.user_id}
+    if event_type:
+        query["event_type"] = event_type
+    
+    # Continuation tokens replace skip; the exact total is only counted on the
+    # first page unless explicitly requested
     try:
-        query = {"user_id": current_user.user_id}
-        if event_type:
-            query["event_type"] = event_type
-        
-        cursor = db.events.find(query).skip(skip).limit(limit).sort("timestamp", -1)
-        events = await cursor.to_list(length=limit)
+        page_query = after_cursor(query, cursor)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if include_total is None:
+        include_total = cursor is None
+    
+    try:
+        budget = get_budget("events")
+        budget.check_size(limit)
+        collection = events_collection(db)
+        find = budget.find(
+            collection.find(storage_query(page_query), storage_projection()).sort(EVENTS_SORT)
+        )
+        if skip and not cursor:
+            find = find.skip(skip)
+        events = await budget.to_list(find.limit(limit + 1), length=limit + 1)
         
-        total = await db.events.count_documents(query)
+        has_more = len(events) > limit
+        events = events[:limit]
+        next_cursor = encode_cursor(events[-1]) if has_more and events else None
         
-        for event in events:
-            event["_id"] = str(event["_id"])
+        total = await budget.count(collection, storage_query(query)) if include_total else None
         
-        return {
+        # ObjectId/datetime are encoded in the same pass as the rest of the body
+        return BSONJSONResponse({
             "success": True,
             "events": events,
             "total": total,
             "skip": skip,
-            "limit": limit
-        }
+            "limit": limit,
+            "has_more": has_more,
+            "next_cursor": next_cursor
+        })
         
+    except BudgetExceeded as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch events: {str(e)}")
 
@@ -93,23 +212,21 @@ async def get_event(
     current_user: TokenData = Depends(verify_jwt_token)
 ):
     try:
-        from bson import ObjectId
-        
-        event = await db.events.find_one({
-            "_id": ObjectId(event_id),
-            "user_id": current_user.user_id
-        })
+        event = await events_collection(db).find_one(
+            storage_query({**event_id_filter(event_id), "user_id": current_user.user_id}),
+            storage_projection()
+        )
         
         if not event:
             raise HTTPException(status_code=404, detail="Event not found")
         
-        event["_id"] = str(event["_id"])
-        
-        return {
+        return BSONJSONResponse({
             "success": True,
             "event": event
-        }
+        })
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch event: {str(e)}")
 
@@ -117,23 +234,44 @@ async def get_event(
 async def delete_event(
     event_id: str,
     db=Depends(get_database),
+    redis_client=Depends(get_redis_client),
     current_user: TokenData = Depends(verify_jwt_token)
 ):
     try:
-        from bson import ObjectId
+        collection = events_collection(db)
+        query = storage_query({**event_id_filter(event_id), "user_id": current_user.user_id})
+        projection = storage_projection(
+            {"user_id": 1, "event_type": 1, "timestamp": 1, "processed": 1, "processed_data": 1}
+        )
         
-        result = await db.events.delete_one({
-            "_id": ObjectId(event_id),
-            "user_id": current_user.user_id
-        })
+        if timeseries_storage():
+            # Time-series collections have no findAndModify, and deletes not
+            # filtered on meta alone need MongoDB 7.0+
+            deleted = await collection.find_one(query, projection)
+            if deleted is not None:
+                try:
+                    await collection.delete_many(query)
+                except OperationFailure as e:
+                    raise HTTPException(
+                        status_code=409,
+                        detail=f"Deleting single events from time-series storage requires MongoDB 7.0+: {e}"
+                    )
+        else:
+            deleted = await collection.find_one_and_delete(query, projection=projection)
         
-        if result.deleted_count == 0:
+        if deleted is None:
             raise HTTPException(status_code=404, detail="Event not found")
         
+        if deleted.get("processed"):
+            await apply_rollups(db, [deleted], sign=-1)
+        await bump_generation(redis_client, [current_user.user_id])
+        
         return {
             "success": True,
             "message": "Event deleted successfully"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete event: {str(e)}")
\ No newline at end of file
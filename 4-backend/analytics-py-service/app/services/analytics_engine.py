@@ -0,0 +1,375 @@
+import asyncio
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+import numpy as np
+from pymongo.errors import ExecutionTimeout
+
+from app.models.data_models import AnalyticsQuery
+from app.services.cache import get_generation
+from app.services.event_store import events_collection, storage_projection, storage_query
+from app.services.query_budget import QueryBudget, get_budget
+from app.services.query_planner import BUCKETS, QueryPlanError
+
+logger = logging.getLogger(__name__)
+
+# /query modes answered here instead of by a Mongo pipeline
+ENGINE_MODES = ("percentiles", "histogram", "rolling", "stats")
+DEFAULT_PERCENTILES = [50, 90, 95, 99]
+DEFAULT_BINS = 20
+DEFAULT_WINDOW = 7
+
+ANALYTICS_ENGINE_BATCH_SIZE = int(os.getenv("ANALYTICS_ENGINE_BATCH_SIZE", 5000))
+# Per-process column cache across users; 0 disables it
+ANALYTICS_ENGINE_CACHE_MB = int(os.getenv("ANALYTICS_ENGINE_CACHE_MB", 256))
+# Jobs with at least this many rows run in the process pool, off the event loop
+ANALYTICS_ENGINE_OFFLOAD_ROWS = int(os.getenv("ANALYTICS_ENGINE_OFFLOAD_ROWS", 50000))
+ANALYTICS_ENGINE_WORKERS = int(os.getenv("ANALYTICS_ENGINE_WORKERS", 2))
+
+NUMERIC_PATH = "processed_data.numeric_value"
+COLUMNS_PROJECTION = {"timestamp": 1, "event_type": 1, NUMERIC_PATH: 1}
+
+class Columns:
+    """One user's numeric events as arrays, in timestamp order"""
+
+    def __init__(self, timestamps: np.ndarray, codes: np.ndarray, labels: List[str], values: np.ndarray):
+        self.timestamps = timestamps  # int64 epoch milliseconds
+        self.codes = codes  # index into labels per row
+        self.labels = labels  # distinct event types
+        self.values = values  # float64 numeric_value
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    @property
+    def nbytes(self) -> int:
+        return self.timestamps.nbytes + self.codes.nbytes + self.values.nbytes
+
+    def filter(self, query: AnalyticsQuery) -> "Columns":
+        mask = np.ones(len(self), dtype=bool)
+        if query.start_date:
+            mask &= self.timestamps >= _epoch_ms(query.start_date)
+        if query.end_date:
+            mask &= self.timestamps <= _epoch_ms(query.end_date)
+        if query.event_types:
+            wanted = [index for index, label in enumerate(self.labels) if label in query.event_types]
+            mask &= np.isin(self.codes, wanted)
+        if mask.all():
+            return self
+        return Columns(self.timestamps[mask], self.codes[mask], self.labels, self.values[mask])
+
+def _epoch_ms(value: datetime) -> int:
+    # Stored timestamps are naive UTC
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return int(np.datetime64(value, "ms").astype(np.int64))
+
+class ColumnCache:
+    """进程内LRU列缓存，按字节上限淘汰，以用户缓存代数判断是否过期"""
+
+    def __init__(self, max_bytes: int = ANALYTICS_ENGINE_CACHE_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._data: "OrderedDict[str, Tuple[int, Columns]]" = OrderedDict()
+
+    def get(self, user_id: str, generation: int) -> Optional[Columns]:
+        entry = self._data.get(user_id)
+        if entry is None:
+            return None
+        if entry[0] != generation:
+            self._evict(user_id)
+            return None
+        self._data.move_to_end(user_id)
+        return entry[1]
+
+    def set(self, user_id: str, generation: int, columns: Columns):
+        if user_id in self._data:
+            self._evict(user_id)
+        if columns.nbytes > self.max_bytes:
+            return
+        self._data[user_id] = (generation, columns)
+        self.bytes += columns.nbytes
+        while self.bytes > self.max_bytes:
+            self._evict(next(iter(self._data)))
+
+    def _evict(self, user_id: str):
+        _, columns = self._data.pop(user_id)
+        self.bytes -= columns.nbytes
+
+column_cache = ColumnCache()
+
+async def load_columns(db, user_id: str, query: Optional[AnalyticsQuery], budget: QueryBudget) -> Columns:
+    """Pull (timestamp, event_type, numeric_value) through a batched, projected cursor"""
+    match: Dict[str, Any] = {"user_id": user_id, NUMERIC_PATH: {"$type": "number"}}
+    if query and query.event_types:
+        match["event_type"] = {"$in": query.event_types}
+    if query and (query.start_date or query.end_date):
+        match["timestamp"] = {}
+        if query.start_date:
+            match["timestamp"]["$gte"] = query.start_date
+        if query.end_date:
+            match["timestamp"]["$lte"] = query.end_date
+
+    cursor = budget.find(
+        events_collection(db).find(storage_query(match), storage_projection(COLUMNS_PROJECTION))
+        .sort("timestamp", 1)
+        .batch_size(ANALYTICS_ENGINE_BATCH_SIZE)
+    )
+    codes_by_type: Dict[str, int] = {}
+    batches: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+    rows = 0
+    try:
+        while batch := await cursor.to_list(length=ANALYTICS_ENGINE_BATCH_SIZE):
+            rows += len(batch)
+            budget.check_size(rows)
+            # Typed per batch in a worker thread, so no Python lists of the whole result pile up
+            batches.append(await asyncio.to_thread(_batch_arrays, batch, codes_by_type))
+    except ExecutionTimeout:
+        raise budget.timed_out()
+
+    return await asyncio.to_thread(_concat_columns, batches, codes_by_type)
+
+def _batch_arrays(batch: List[dict], codes_by_type: Dict[str, int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    timestamps = np.array([doc["timestamp"] for doc in batch], dtype="datetime64[ms]").astype(np.int64)
+    codes = np.fromiter(
+        (codes_by_type.setdefault(doc["event_type"], len(codes_by_type)) for doc in batch),
+        dtype=np.int64, count=len(batch)
+    )
+    values = np.fromiter(
+        (doc["processed_data"]["numeric_value"] for doc in batch),
+        dtype=np.float64, count=len(batch)
+    )
+    return timestamps, codes, values
+
+def _concat_columns(batches: list, codes_by_type: Dict[str, int]) -> Columns:
+    if not batches:
+        return Columns(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), [], np.empty(0))
+    # Codes were handed out in first-seen order; renumber them to sorted labels
+    labels = sorted(codes_by_type, key=str)
+    remap = np.empty(len(labels), dtype=np.int64)
+    for index, label in enumerate(labels):
+        remap[codes_by_type[label]] = index
+    return Columns(
+        np.concatenate([batch[0] for batch in batches]),
+        remap[np.concatenate([batch[1] for batch in batches])],
+        [str(label) for label in labels],
+        np.concatenate([batch[2] for batch in batches])
+    )
+
+async def get_columns(db, redis_client, user_id: str, query: AnalyticsQuery, budget: QueryBudget) -> Columns:
+    """
+    With the cache on, a user's full history is loaded once per cache generation
+    (bumped on every write) and each query filters it in memory
+    """
+    generation = None
+    if ANALYTICS_ENGINE_CACHE_MB and redis_client:
+        try:
+            generation = await get_generation(redis_client, user_id)
+        except Exception as e:
+            logger.warning(f"Cache generation unavailable, loading columns directly: {e}")
+    if generation is None:
+        return await load_columns(db, user_id, query, budget)
+
+    columns = column_cache.get(user_id, generation)
+    if columns is None:
+        columns = await load_columns(db, user_id, None, budget)
+        column_cache.set(user_id, generation, columns)
+    return columns.filter(query)
+
+def _bucket_keys(timestamps: np.ndarray, unit: str) -> np.ndarray:
+    moments = timestamps.astype("datetime64[ms]")
+    if unit == "hour":
+        return moments.astype("datetime64[h]")
+    days = moments.astype("datetime64[D]")
+    if unit == "week":
+        # 1970-01-01 was a Thursday; step back to the Monday of each week
+        day_numbers = days.astype(np.int64)
+        return (day_numbers - (day_numbers + 3) % 7).astype("datetime64[D]")
+    return days
+
+def _bucket_step(unit: str) -> np.timedelta64:
+    if unit == "hour":
+        return np.timedelta64(1, "h")
+    return np.timedelta64(7 if unit == "week" else 1, "D")
+
+def _float(value) -> Optional[float]:
+    value = float(value)
+    return None if np.isnan(value) else value
+
+def _datetime(value: np.datetime64):
+    return value.astype("datetime64[ms]").tolist()
+
+def _groups(timestamps, codes, labels, bucket: Optional[str], by_type: bool) -> Tuple[np.ndarray, list]:
+    """Row -> group index, and the _id of each group in the planner's result shape"""
+    keys = np.zeros(len(timestamps), dtype=np.int64)
+    bucket_values = None
+    width = max(len(labels), 1)
+    if bucket:
+        bucket_values, keys = np.unique(_bucket_keys(timestamps, bucket), return_inverse=True)
+    if by_type:
+        keys = keys * width + codes
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+
+    group_ids = []
+    for key in unique_keys.tolist():
+        bucket_id = _datetime(bucket_values[key // width if by_type else key]) if bucket else None
+        type_id = labels[key % width] if by_type else None
+        if bucket and by_type:
+            group_ids.append({"group": type_id, "bucket": bucket_id})
+        else:
+            group_ids.append(bucket_id if bucket else type_id)
+    return inverse, group_ids
+
+def _sorted_groups(inverse: np.ndarray, values: np.ndarray, group_count: int):
+    counts = np.bincount(inverse, minlength=group_count)
+    order = np.argsort(inverse, kind="stable")
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    return counts, values[order], starts
+
+def _percentiles(inverse, group_ids, values, percentiles: List[float]) -> list:
+    counts, ordered, starts = _sorted_groups(inverse, values, len(group_ids))
+    results = []
+    for index, group_id in enumerate(group_ids):
+        points = np.percentile(ordered[starts[index]:starts[index] + counts[index]], percentiles)
+        results.append({
+            "_id": group_id,
+            "count": int(counts[index]),
+            "percentiles": {f"p{rank:g}": _float(point) for rank, point in zip(percentiles, points)}
+        })
+    return results
+
+def _stats(inverse, group_ids, values) -> list:
+    counts, ordered, starts = _sorted_groups(inverse, values, len(group_ids))
+    sums = np.bincount(inverse, weights=values, minlength=len(group_ids))
+    squares = np.bincount(inverse, weights=values * values, minlength=len(group_ids))
+    means = sums / counts
+    stds = np.sqrt(np.maximum(squares / counts - means * means, 0))
+    mins = np.minimum.reduceat(ordered, starts)
+    maxs = np.maximum.reduceat(ordered, starts)
+    return [
+        {
+            "_id": group_id,
+            "count": int(counts[index]),
+            "total": _float(sums[index]),
+            "average": _float(means[index]),
+            "min": _float(mins[index]),
+            "max": _float(maxs[index]),
+            "stddev": _float(stds[index])
+        }
+        for index, group_id in enumerate(group_ids)
+    ]
+
+def _histogram(values, bins: int) -> list:
+    counts, edges = np.histogram(values, bins=bins)
+    return [
+        {"lower": float(edges[index]), "upper": float(edges[index + 1]), "count": int(count)}
+        for index, count in enumerate(counts.tolist())
+    ]
+
+def _rolling(timestamps, values, unit: str, window: int) -> list:
+    """Per-bucket mean plus a trailing mean over `window` buckets, empty buckets included"""
+    keys = _bucket_keys(timestamps, unit)
+    step = _bucket_step(unit)
+    first = keys.min()
+    positions = ((keys - first) // step).astype(np.int64)
+    size = int(positions.max()) + 1
+    counts = np.bincount(positions, minlength=size)
+    sums = np.bincount(positions, weights=values, minlength=size)
+
+    ends = np.arange(1, size + 1)
+    begins = np.maximum(ends - window, 0)
+    count_totals = np.concatenate(([0], np.cumsum(counts)))
+    sum_totals = np.concatenate(([0.0], np.cumsum(sums)))
+    rolling_counts = count_totals[ends] - count_totals[begins]
+    rolling_sums = sum_totals[ends] - sum_totals[begins]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts
+        rolling_means = rolling_sums / rolling_counts
+    return [
+        {
+            "_id": _datetime(first + index * step),
+            "count": int(counts[index]),
+            "average": _float(means[index]),
+            "rolling_count": int(rolling_counts[index]),
+            "rolling_average": _float(rolling_means[index])
+        }
+        for index in range(size)
+    ]
+
+def compute(mode: str, params: dict, timestamps: np.ndarray, codes: np.ndarray,
+            labels: List[str], values: np.ndarray) -> list:
+    """Pure NumPy; module-level so the process pool can run it"""
+    if not len(values):
+        return []
+    if mode == "histogram":
+        return _histogram(values, params["bins"])
+    if mode == "rolling":
+        return _rolling(timestamps, values, params["bucket"], params["window"])
+    inverse, group_ids = _groups(timestamps, codes, labels, params["bucket"], params["group_by"] == "event_type")
+    if mode == "percentiles":
+        return _percentiles(inverse, group_ids, values, params["percentiles"])
+    return _stats(inverse, group_ids, values)
+
+def validate_engine_query(query: AnalyticsQuery) -> dict:
+    """Check an engine-mode query and resolve its defaults"""
+    if query.mode not in ENGINE_MODES:
+        raise QueryPlanError(f"Unsupported mode '{query.mode}'. Available: {['aggregate', *ENGINE_MODES]}")
+    if query.bucket and query.bucket not in BUCKETS:
+        raise QueryPlanError(f"Unsupported bucket '{query.bucket}'. Available: {list(BUCKETS)}")
+    if query.group_by and query.mode in ("histogram", "rolling"):
+        raise QueryPlanError(f"Mode '{query.mode}' does not support group_by")
+    if query.group_by not in (None, "event_type"):
+        raise QueryPlanError(f"Mode '{query.mode}' can only group by event_type")
+    if query.start_date and query.end_date and query.start_date > query.end_date:
+        raise QueryPlanError("start_date must not be after end_date")
+
+    percentiles = query.percentiles or ([query.percentile] if query.percentile is not None else DEFAULT_PERCENTILES)
+    if any(rank < 0 or rank > 100 for rank in percentiles):
+        raise QueryPlanError("percentiles must be between 0 and 100")
+    return {
+        "bucket": query.bucket or ("day" if query.mode == "rolling" else None),
+        "group_by": query.group_by,
+        "percentiles": [float(rank) for rank in percentiles],
+        "bins": query.bins or DEFAULT_BINS,
+        "window": query.window or DEFAULT_WINDOW
+    }
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+def _pool() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn: forking a process that runs an event loop and driver threads is unsafe
+        _executor = ProcessPoolExecutor(
+            max_workers=ANALYTICS_ENGINE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
+
+def shutdown_engine():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+async def run_engine_query(db, redis_client, user_id: str, query: AnalyticsQuery) -> dict:
+    params = validate_engine_query(query)
+    columns = await get_columns(db, redis_client, user_id, query, get_budget("engine"))
+
+    args = (query.mode, params, columns.timestamps, columns.codes, columns.labels, columns.values)
+    if len(columns) >= ANALYTICS_ENGINE_OFFLOAD_ROWS:
+        results = await asyncio.get_running_loop().run_in_executor(_pool(), compute, *args)
+    else:
+        results = compute(*args)
+
+    get_budget("query").check_size(len(results))
+    return {
+        "total_events": len(columns),
+        "results": results,
+        "source": "engine"
+    }
\ No newline at end of file
@@ -0,0 +1,152 @@
+import asyncio
+import gzip
+import os
+import zlib
+from datetime import date, datetime, timedelta
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+import logging
+from bson import json_util
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - gzip fallback
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Events older than this are moved to archive files by app.tasks.archive_events; 0 disables it
+EVENTS_ARCHIVE_DAYS = int(os.getenv("EVENTS_ARCHIVE_DAYS", 0))
+# Local or mounted directory holding the date-partitioned archive
+EVENTS_ARCHIVE_PATH = os.getenv("EVENTS_ARCHIVE_PATH", "/data/archive/events")
+# Users are hashed into shards inside each day, so a per-user read opens a fraction of the files
+EVENTS_ARCHIVE_SHARDS = int(os.getenv("EVENTS_ARCHIVE_SHARDS", 16))
+EVENTS_ARCHIVE_COMPRESSION = os.getenv("EVENTS_ARCHIVE_COMPRESSION", "zstd" if zstandard else "gzip")
+EVENTS_ARCHIVE_ZSTD_LEVEL = int(os.getenv("EVENTS_ARCHIVE_ZSTD_LEVEL", 10))
+
+SUFFIXES = {"zstd": ".ndjson.zst", "gzip": ".ndjson.gz"}
+
+# Extended JSON keeps ObjectIds and datetimes round-trippable; timestamps stay naive UTC like in Mongo
+JSON_OPTIONS = json_util.RELAXED_JSON_OPTIONS.with_options(tz_aware=False)
+
+def archiving_enabled() -> bool:
+    return EVENTS_ARCHIVE_DAYS > 0
+
+def user_shard(user_id: str) -> int:
+    # crc32 rather than hash(): shard numbers must agree across processes and restarts
+    return zlib.crc32(str(user_id).encode()) % EVENTS_ARCHIVE_SHARDS
+
+def partition_dir(day: date, shard: int) -> str:
+    return os.path.join(EVENTS_ARCHIVE_PATH, f"date={day.isoformat()}", f"shard={shard:02d}")
+
+def _compress(payload: bytes) -> bytes:
+    if EVENTS_ARCHIVE_COMPRESSION == "zstd":
+        if zstandard is None:
+            raise RuntimeError("EVENTS_ARCHIVE_COMPRESSION=zstd needs the zstandard package")
+        return zstandard.ZstdCompressor(level=EVENTS_ARCHIVE_ZSTD_LEVEL).compress(payload)
+    return gzip.compress(payload)
+
+def _decompress(path: str, raw: bytes) -> bytes:
+    if path.endswith(SUFFIXES["zstd"]):
+        if zstandard is None:
+            raise RuntimeError(f"Reading {path} needs the zstandard package")
+        return zstandard.ZstdDecompressor().decompress(raw)
+    return gzip.decompress(raw)
+
+def _fsync_dir(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def write_partition(day: date, shard: int, name: str, events: List[dict]) -> str:
+    """
+    Write one compressed NDJSON file and make it durable: data fsynced, then
+    renamed into place, then the directory fsynced. Rewriting the same name
+    replaces the file, so a replayed batch does not duplicate rows
+    """
+    directory = partition_dir(day, shard)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name + SUFFIXES[EVENTS_ARCHIVE_COMPRESSION])
+    payload = "".join(json_util.dumps(event, json_options=JSON_OPTIONS) + "\n" for event in events)
+
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as fh:
+        fh.write(_compress(payload.encode()))
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(temporary, path)
+    _fsync_dir(directory)
+    return path
+
+def write_batch(name: str, events: Iterable[dict]) -> List[str]:
+    """Split a batch by day and user shard and write one file per partition"""
+    partitions: Dict[Tuple[date, int], List[dict]] = {}
+    for event in events:
+        key = (event["timestamp"].date(), user_shard(event["user_id"]))
+        partitions.setdefault(key, []).append(event)
+    return [write_partition(day, shard, name, batch) for (day, shard), batch in sorted(partitions.items())]
+
+def partition_files(user_id: str, start: Optional[datetime], end: Optional[datetime]) -> List[str]:
+    """Archive files that can hold this user's events in [start, end], newest day first"""
+    if not os.path.isdir(EVENTS_ARCHIVE_PATH):
+        return []
+    shard = f"shard={user_shard(user_id):02d}"
+    files = []
+    for entry in sorted(os.listdir(EVENTS_ARCHIVE_PATH), reverse=True):
+        if not entry.startswith("date="):
+            continue
+        try:
+            day = date.fromisoformat(entry[len("date="):])
+        except ValueError:
+            continue
+        if (start and day < start.date()) or (end and day > end.date()):
+            continue
+        directory = os.path.join(EVENTS_ARCHIVE_PATH, entry, shard)
+        if os.path.isdir(directory):
+            files.extend(
+                os.path.join(directory, name) for name in sorted(os.listdir(directory))
+                if name.endswith(tuple(SUFFIXES.values()))
+            )
+    return files
+
+def read_partition(path: str, user_id: str, start: Optional[datetime], end: Optional[datetime],
+                   fields: Optional[List[str]] = None) -> List[dict]:
+    with open(path, "rb") as fh:
+        lines = _decompress(path, fh.read()).decode().splitlines()
+    events = []
+    for line in lines:
+        event = json_util.loads(line, json_options=JSON_OPTIONS)
+        if event.get("user_id") != user_id:
+            continue
+        if (start and event["timestamp"] < start) or (end and event["timestamp"] > end):
+            continue
+        if fields:
+            event = {field: event[field] for field in fields if field in event}
+        events.append(event)
+    events.sort(key=lambda event: event["timestamp"], reverse=True)
+    return events
+
+async def iter_archived_events(user_id: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                               fields: Optional[List[str]] = None) -> AsyncIterator[dict]:
+    """
+    A user's archived events in [start, end], newest day first; file reads run
+    in a thread so the event loop is never blocked on disk
+    """
+    if not archiving_enabled():
+        return
+    for path in await asyncio.to_thread(partition_files, user_id, start, end):
+        for event in await asyncio.to_thread(read_partition, path, user_id, start, end, fields):
+            yield event
+
+async def load_archived_events(user_id: str, start: Optional[datetime], end: Optional[datetime],
+                               limit: int, fields: Optional[List[str]] = None) -> List[dict]:
+    events = []
+    async for event in iter_archived_events(user_id, start, end, fields):
+        if len(events) >= limit:
+            break
+        events.append(event)
+    return events
+
+def archive_cutoff(now: Optional[datetime] = None) -> datetime:
+    return (now or datetime.utcnow()) - timedelta(days=EVENTS_ARCHIVE_DAYS)
\ No newline at end of file
@@ -0,0 +1,146 @@
+import asyncio
+import hashlib
+import json
+import os
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+import logging
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_CACHE_TTL = int(os.getenv("ANALYTICS_CACHE_TTL", 60))
+# How long a cache filler holds the cross-process lock before others give up waiting
+ANALYTICS_CACHE_LOCK_MS = int(os.getenv("ANALYTICS_CACHE_LOCK_MS", 5000))
+ANALYTICS_CACHE_POLL_MS = 50
+
+def _generation_key(user_id: str) -> str:
+    return f"analytics:gen:{user_id}"
+
+def normalize_params(params: Optional[Dict[str, Any]]) -> str:
+    """Stable representation of query parameters, independent of ordering"""
+    normalized = {}
+    for name, value in (params or {}).items():
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple, set)):
+            value = sorted(str(item) for item in value)
+        normalized[name] = value
+    return json.dumps(jsonable_encoder(normalized), sort_keys=True, separators=(",", ":"))
+
+def cache_key(namespace: str, user_id: str, generation: int, params: Optional[Dict[str, Any]]) -> str:
+    digest = hashlib.sha1(normalize_params(params).encode()).hexdigest()
+    return f"analytics:cache:{namespace}:{user_id}:{generation}:{digest}"
+
+async def bump_generation(redis_client, user_ids: Iterable[str]):
+    """
+    Invalidate every cached response for these users by moving them to a new generation
+    """
+    user_ids = set(user_ids)
+    if not redis_client or not user_ids:
+        return
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.incr(_generation_key(user_id))
+        await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to bump analytics cache generation: {e}")
+
+async def get_generation(redis_client, user_id: str) -> int:
+    """Current cache generation for a user; changes whenever their events do"""
+    return int(await redis_client.get(_generation_key(user_id)) or 0)
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class AnalyticsCache:
+    """Redis响应缓存，按用户代数失效，并发未命中时单飞计算"""
+
+    def __init__(self, ttl: int = ANALYTICS_CACHE_TTL):
+        self.ttl = ttl
+        self._inflight: Dict[str, _Flight] = {}
+
+    async def get_or_compute(
+        self,
+        redis_client,
+        namespace: str,
+        user_id: str,
+        params: Optional[Dict[str, Any]],
+        compute: Callable[[], Awaitable[Any]],
+        ttl: Optional[int] = None
+    ) -> Any:
+        if not redis_client:
+            return await compute()
+
+        try:
+            generation = await get_generation(redis_client, user_id)
+            key = cache_key(namespace, user_id, generation, params)
+            cached = await redis_client.get(key)
+        except Exception as e:
+            logger.warning(f"Analytics cache unavailable, computing directly: {e}")
+            return await compute()
+
+        if cached is not None:
+            return json.loads(cached)
+
+        # Single flight inside this process: the fill runs as its own task shared
+        # by every waiter, and is only cancelled once all of them have gone away
+        flight = self._inflight.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(self._fill(redis_client, key, compute, ttl or self.ttl)))
+            self._inflight[key] = flight
+            flight.task.add_done_callback(lambda task: self._finish(key, flight))
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _finish(self, key: str, flight: "_Flight"):
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+        if not flight.task.cancelled():
+            # Mark the exception retrieved even if every waiter was cancelled
+            flight.task.exception()
+
+    async def _fill(self, redis_client, key: str, compute, ttl: int) -> Any:
+        lock_key = f"{key}:lock"
+        try:
+            acquired = await redis_client.set(lock_key, "1", nx=True, px=ANALYTICS_CACHE_LOCK_MS)
+        except Exception:
+            acquired = True
+
+        if not acquired:
+            # Another process is filling this key; wait for its result
+            waited = 0
+            while waited < ANALYTICS_CACHE_LOCK_MS:
+                await asyncio.sleep(ANALYTICS_CACHE_POLL_MS / 1000)
+                waited += ANALYTICS_CACHE_POLL_MS
+                cached = await redis_client.get(key)
+                if cached is not None:
+                    return json.loads(cached)
+
+        try:
+            result = jsonable_encoder(await compute(), custom_encoder={ObjectId: str})
+            try:
+                await redis_client.set(key, json.dumps(result), ex=ttl)
+            except Exception as e:
+                logger.warning(f"Failed to store analytics cache entry: {e}")
+            return result
+        finally:
+            if acquired:
+                try:
+                    await redis_client.delete(lock_key)
+                except Exception:
+                    pass
+
+# 全局分析缓存实例
+analytics_cache = AnalyticsCache()
@@ -0,0 +1,145 @@
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+CARDINALITY_TRACKING = os.getenv("CARDINALITY_TRACKING", "true").lower() == "true"
+# Hourly keys back the sliding rate windows, daily keys the day-range distinct counts
+CARDINALITY_HOURLY_RETENTION_HOURS = int(os.getenv("CARDINALITY_HOURLY_RETENTION_HOURS", 72))
+CARDINALITY_DAILY_RETENTION_DAYS = int(os.getenv("CARDINALITY_DAILY_RETENTION_DAYS", 90))
+# How long a merged multi-period sketch is reused before it is merged again
+CARDINALITY_MERGE_TTL = int(os.getenv("CARDINALITY_MERGE_TTL", 60))
+
+# Pseudo event type that every event is also counted under
+ALL_EVENTS = "*"
+
+GRANULARITIES = {
+    "hour": ("%Y%m%d%H", timedelta(hours=1)),
+    "day": ("%Y%m%d", timedelta(days=1)),
+}
+
+def users_key(event_type: str, granularity: str, period: str) -> str:
+    return f"analytics:hll:users:{event_type}:{granularity}:{period}"
+
+def count_key(event_type: str, granularity: str, period: str) -> str:
+    return f"analytics:count:{event_type}:{granularity}:{period}"
+
+def max_periods(granularity: str) -> int:
+    """How many periods back the keys for a granularity are kept"""
+    if granularity == "hour":
+        return CARDINALITY_HOURLY_RETENTION_HOURS
+    return CARDINALITY_DAILY_RETENTION_DAYS
+
+def floor_period(moment: datetime, granularity: str) -> datetime:
+    moment = moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0) if granularity == "day" else moment
+
+def _naive_utc(moment: datetime) -> datetime:
+    # Periods are labelled in UTC, like the stored event timestamps
+    if moment.tzinfo is not None:
+        return moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+def period_count(start: datetime, end: datetime, granularity: str) -> int:
+    """Number of labels period_range would return, without building them"""
+    step = GRANULARITIES[granularity][1]
+    start, end = floor_period(_naive_utc(start), granularity), _naive_utc(end)
+    if end < start:
+        return 0
+    return (end - start) // step + 1
+
+def period_range(start: datetime, end: datetime, granularity: str) -> List[str]:
+    """Period labels covering [start, end], oldest first"""
+    fmt, step = GRANULARITIES[granularity]
+    start, end = _naive_utc(start), _naive_utc(end)
+    moment = floor_period(start, granularity)
+    periods = []
+    while moment <= end:
+        periods.append(moment.strftime(fmt))
+        moment += step
+    return periods
+
+async def record_events(redis_client, events: Iterable[dict]):
+    """
+    Feed the unique-user HyperLogLogs and event counters for freshly written
+    events. Best effort, like the cache generation bump: a Redis hiccup loses
+    counts but never fails the write
+    """
+    if not redis_client or not CARDINALITY_TRACKING:
+        return
+    users: Dict[Tuple[str, str, str], set] = {}
+    counts: Dict[Tuple[str, str, str], int] = {}
+    for event in events:
+        moment = event.get("timestamp") or datetime.utcnow()
+        for event_type in (event["event_type"], ALL_EVENTS):
+            for granularity, (fmt, _) in GRANULARITIES.items():
+                key = (event_type, granularity, moment.strftime(fmt))
+                users.setdefault(key, set()).add(event["user_id"])
+                counts[key] = counts.get(key, 0) + 1
+    if not counts:
+        return
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for key, user_ids in users.items():
+            ttl = max_periods(key[1]) * int(GRANULARITIES[key[1]][1].total_seconds())
+            pipe.pfadd(users_key(*key), *user_ids)
+            pipe.expire(users_key(*key), ttl)
+            pipe.incrby(count_key(*key), counts[key])
+            pipe.expire(count_key(*key), ttl)
+        await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to record cardinality counters: {e}")
+
+async def distinct_users(redis_client, event_type: str, start: datetime, end: datetime,
+                         granularity: str = "day") -> dict:
+    """
+    Approximate distinct users per period and over the whole range (~0.81%
+    standard error). The range total comes from a PFMERGE of the period
+    sketches, cached for CARDINALITY_MERGE_TTL seconds
+    """
+    periods = period_range(start, end, granularity)
+    keys = [users_key(event_type, granularity, period) for period in periods]
+
+    pipe = redis_client.pipeline(transaction=False)
+    for key in keys:
+        pipe.pfcount(key)
+    per_period = await pipe.execute()
+
+    if len(keys) == 1:
+        total = per_period[0]
+    else:
+        merged = f"analytics:hll:merged:{event_type}:{granularity}:{periods[0]}:{periods[-1]}"
+        if not await redis_client.exists(merged):
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.pfmerge(merged, *keys)
+            pipe.expire(merged, CARDINALITY_MERGE_TTL)
+            await pipe.execute()
+        total = await redis_client.pfcount(merged)
+
+    return {
+        "event_type": event_type,
+        "granularity": granularity,
+        "distinct_users": total,
+        "series": [{"period": period, "distinct_users": count} for period, count in zip(periods, per_period)]
+    }
+
+async def event_rates(redis_client, event_type: str, granularity: str, periods: int,
+                      now: Optional[datetime] = None) -> dict:
+    """Event counts over the last `periods` periods, the current partial one included"""
+    now = now or datetime.utcnow()
+    step = GRANULARITIES[granularity][1]
+    labels = period_range(now - step * (periods - 1), now, granularity)
+    values = await redis_client.mget([count_key(event_type, granularity, label) for label in labels])
+    counts = [int(value or 0) for value in values]
+    total = sum(counts)
+
+    window_seconds = (periods - 1) * step.total_seconds() + (now - floor_period(now, granularity)).total_seconds()
+    return {
+        "event_type": event_type,
+        "granularity": granularity,
+        "total_events": total,
+        "events_per_second": round(total / window_seconds, 6) if window_seconds else None,
+        "series": [{"period": label, "count": count} for label, count in zip(labels, counts)]
+    }
\ No newline at end of file
@@ -0,0 +1,41 @@
+import os
+from datetime import datetime
+from typing import List
+
+# Redis Stream carrying newly recorded events to the processing workers
+DATA_EVENTS_STREAM = os.getenv("DATA_EVENTS_STREAM", "data_events_stream")
+DATA_EVENTS_GROUP = os.getenv("DATA_EVENTS_GROUP", "event_processors")
+DATA_EVENTS_STREAM_MAXLEN = int(os.getenv("DATA_EVENTS_STREAM_MAXLEN", 100000))
+
+# "inline" processes in the API process via BackgroundTasks,
+# "worker" leaves processing to `python -m app.tasks.worker`,
+# "change_stream" to `python -m app.tasks.change_stream`, which tails inserts
+# on events itself. Only worker mode has a consumer, so only it queues events
+EVENT_PROCESSING_MODE = os.getenv("EVENT_PROCESSING_MODE", "inline")
+
+def process_inline() -> bool:
+    return EVENT_PROCESSING_MODE not in ("worker", "change_stream")
+
+async def enqueue_events(redis_client, events: List[dict]):
+    """
+    Append events to the processing stream with one pipelined round trip;
+    a no-op unless the worker consumes the stream
+    """
+    if not redis_client or not events or EVENT_PROCESSING_MODE != "worker":
+        return
+
+    queued_at = datetime.utcnow().isoformat()
+    pipe = redis_client.pipeline(transaction=False)
+    for event in events:
+        pipe.xadd(
+            DATA_EVENTS_STREAM,
+            {
+                "event_id": str(event["_id"]),
+                "event_type": event["event_type"],
+                "user_id": event["user_id"],
+                "timestamp": queued_at
+            },
+            maxlen=DATA_EVENTS_STREAM_MAXLEN,
+            approximate=True
+        )
+    await pipe.execute()
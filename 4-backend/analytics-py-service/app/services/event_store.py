@@ -0,0 +1,109 @@
+import os
+from typing import List, Optional
+import logging
+from bson import ObjectId
+from pymongo.errors import CollectionInvalid
+
+logger = logging.getLogger(__name__)
+
+# "collection" keeps one document per event in `events`; "timeseries" writes
+# events into a MongoDB time-series collection bucketed by user and event type
+EVENTS_STORAGE = os.getenv("EVENTS_STORAGE", "collection")
+EVENTS_TIMESERIES_COLLECTION = os.getenv("EVENTS_TIMESERIES_COLLECTION", "events_ts")
+EVENTS_TIMESERIES_GRANULARITY = os.getenv("EVENTS_TIMESERIES_GRANULARITY", "minutes")
+# expireAfterSeconds on the time-series collection; 0 keeps events forever
+EVENTS_TIMESERIES_RETENTION_DAYS = int(os.getenv("EVENTS_TIMESERIES_RETENTION_DAYS", 30))
+
+META_FIELD = "meta"
+META_KEYS = ("user_id", "event_type")
+# The flat event shape routes, exports and serializers work with
+EVENT_FIELDS = ("_id", "event_type", "user_id", "timestamp", "event_data", "metadata", "processed", "processed_data")
+
+def timeseries_storage() -> bool:
+    return EVENTS_STORAGE == "timeseries"
+
+def events_collection_name() -> str:
+    return EVENTS_TIMESERIES_COLLECTION if timeseries_storage() else "events"
+
+def events_collection(db):
+    return db[events_collection_name()]
+
+def event_id_candidates(event_ids: List[str]) -> list:
+    """Events may be keyed by a stringified or a native ObjectId"""
+    candidates = []
+    for event_id in event_ids:
+        candidates.append(event_id)
+        if isinstance(event_id, str) and ObjectId.is_valid(event_id):
+            candidates.append(ObjectId(event_id))
+    return candidates
+
+def event_id_filter(event_id: str) -> dict:
+    return {"_id": {"$in": event_id_candidates([event_id])}}
+
+def _translate(query: dict) -> dict:
+    translated = {}
+    for key, value in query.items():
+        if key in ("$and", "$or", "$nor"):
+            translated[key] = [_translate(clause) for clause in value]
+        elif key in META_KEYS:
+            translated[f"{META_FIELD}.{key}"] = value
+        else:
+            translated[key] = value
+    return translated
+
+def storage_query(query: dict) -> dict:
+    """Rewrite a filter on flat event fields for the configured storage"""
+    return _translate(query) if timeseries_storage() else query
+
+def storage_projection(projection: Optional[dict] = None) -> Optional[dict]:
+    """Project stored documents back to the flat event shape"""
+    if not timeseries_storage():
+        return projection
+    fields = [field for field, include in projection.items() if include] if projection else EVENT_FIELDS
+    return {field: f"${META_FIELD}.{field}" if field in META_KEYS else 1 for field in fields}
+
+def storage_pipeline(pipeline: List[dict]) -> List[dict]:
+    """
+    Translate the leading $match (so time-series buckets are filtered on meta)
+    and lift the meta fields so the remaining stages see flat events
+    """
+    if not timeseries_storage():
+        return pipeline
+    lift = {"$addFields": {key: f"${META_FIELD}.{key}" for key in META_KEYS}}
+    if pipeline and "$match" in pipeline[0]:
+        return [{"$match": _translate(pipeline[0]["$match"])}, lift] + pipeline[1:]
+    return [lift] + pipeline
+
+def to_timeseries_document(event: dict) -> dict:
+    """Flat event -> time-series measurement with user/event type as metadata"""
+    document = {field: event[field] for field in EVENT_FIELDS if field in event and field not in META_KEYS}
+    document[META_FIELD] = {key: event.get(key) for key in META_KEYS}
+    event_id = document.get("_id")
+    if isinstance(event_id, str) and ObjectId.is_valid(event_id):
+        document["_id"] = ObjectId(event_id)
+    return document
+
+async def ensure_timeseries_collection(db):
+    """Create the time-series events collection, or retune its retention"""
+    name = EVENTS_TIMESERIES_COLLECTION
+    expire_after = EVENTS_TIMESERIES_RETENTION_DAYS * 86400
+    if name in await db.list_collection_names(filter={"name": name}):
+        await db.command({"collMod": name, "expireAfterSeconds": expire_after or "off"})
+        return
+
+    options = {
+        "timeseries": {
+            "timeField": "timestamp",
+            "metaField": META_FIELD,
+            "granularity": EVENTS_TIMESERIES_GRANULARITY
+        }
+    }
+    if expire_after:
+        options["expireAfterSeconds"] = expire_after
+    try:
+        await db.create_collection(name, **options)
+        logger.info(f"Created time-series collection {name} "
+                    f"(retention {EVENTS_TIMESERIES_RETENTION_DAYS or 'unlimited'} days)")
+    except CollectionInvalid:
+        # Another process created it first
+        pass
\ No newline at end of file
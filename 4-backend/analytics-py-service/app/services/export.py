@@ -0,0 +1,104 @@
+import csv
+import io
+import json
+import os
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Optional
+from bson import ObjectId
+
+from app.services.archive import iter_archived_events
+from app.services.event_store import events_collection, storage_projection, storage_query
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+EXPORT_MAX_ROWS = int(os.getenv("EXPORT_MAX_ROWS", 1000000))
+
+# Stable column order for CSV exports; also the projection sent to Mongo
+EXPORT_FIELDS = ["_id", "event_type", "user_id", "timestamp", "processed", "event_data", "metadata", "processed_data"]
+EXPORT_PROJECTION = {field: 1 for field in EXPORT_FIELDS}
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "gzip": "application/gzip",
+}
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def _csv_cell(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=_json_default, separators=(",", ":"))
+    return str(value)
+
+def _encode_ndjson(event: dict) -> str:
+    return json.dumps(event, default=_json_default, separators=(",", ":")) + "\n"
+
+async def _iter_chunks(cursor, fmt: str) -> AsyncIterator[bytes]:
+    """Encode the cursor one Mongo batch at a time so memory stays flat"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == "csv" else None
+    if writer:
+        writer.writerow(EXPORT_FIELDS)
+
+    rows = 0
+    async for event in cursor:
+        if writer:
+            writer.writerow([_csv_cell(event.get(field)) for field in EXPORT_FIELDS])
+        else:
+            buffer.write(_encode_ndjson(event))
+        rows += 1
+        if rows % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+
+    remainder = buffer.getvalue()
+    if remainder:
+        yield remainder.encode()
+
+async def stream_events(cursor, fmt: str = "ndjson", compress: bool = False) -> AsyncIterator[bytes]:
+    """
+    Stream export rows as NDJSON or CSV, optionally gzip-compressed on the fly
+    """
+    if not compress:
+        async for chunk in _iter_chunks(cursor, fmt):
+            yield chunk
+        return
+
+    compressor = zlib.compressobj(wbits=31)  # gzip container
+    async for chunk in _iter_chunks(cursor, fmt):
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def export_cursor(db, query: dict, limit: Optional[int] = None):
+    row_cap = min(limit or EXPORT_MAX_ROWS, EXPORT_MAX_ROWS)
+    return events_collection(db).find(storage_query(query), storage_projection(EXPORT_PROJECTION)) \
+        .sort("timestamp", -1) \
+        .batch_size(EXPORT_BATCH_SIZE) \
+        .limit(row_cap)
+
+
+async def with_archived(cursor, user_id: str, start: Optional[datetime], end: Optional[datetime],
+                        limit: Optional[int] = None) -> AsyncIterator[dict]:
+    """Live rows first, then archived rows for any part of the range that was archived"""
+    row_cap = min(limit or EXPORT_MAX_ROWS, EXPORT_MAX_ROWS)
+    rows = 0
+    async for event in cursor:
+        rows += 1
+        yield event
+    async for event in iter_archived_events(user_id, start, end, EXPORT_FIELDS):
+        if rows >= row_cap:
+            return
+        rows += 1
+        yield event
\ No newline at end of file
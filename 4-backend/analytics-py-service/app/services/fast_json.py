@@ -0,0 +1,40 @@
+import json
+from datetime import datetime
+from decimal import Decimal
+from typing import Any
+from bson import ObjectId
+from bson.decimal128 import Decimal128
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - stdlib fallback
+    orjson = None
+
+def _bson_default(value: Any):
+    """Types neither orjson nor json handle natively"""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, Decimal128):
+        return float(value.to_decimal())
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_bson_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_bson_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+class BSONJSONResponse(JSONResponse):
+    """
+    Serialize Mongo documents (ObjectId, datetime, nested event_data) in one pass,
+    bypassing FastAPI's jsonable_encoder; routes opt in by returning it directly
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,106 @@
+import base64
+import hashlib
+import os
+from typing import Optional
+import logging
+
+from app.config.redis_config import get_redis_client
+from app.services.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+GRPC_CACHE_TTL = int(os.getenv('GRPC_CACHE_TTL', 300))
+GRPC_CACHE_MAXSIZE = int(os.getenv('GRPC_CACHE_MAXSIZE', 1024))
+GRPC_CACHE_REDIS = os.getenv('GRPC_CACHE_REDIS', 'false').lower() == 'true'
+
+class ReferenceDataCache:
+    """
+    business-service参考数据缓存：进程内LRU为一级，可选Redis为二级
+    缓存序列化后的protobuf字节，键包含完整请求字段和调用者角色
+    """
+
+    REDIS_PREFIX = "grpc:cache"
+
+    def __init__(self, ttl: int = GRPC_CACHE_TTL, maxsize: int = GRPC_CACHE_MAXSIZE,
+                 use_redis: bool = GRPC_CACHE_REDIS):
+        self.ttl = ttl
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.use_redis = use_redis
+        self.hits = 0
+        self.misses = 0
+        self.redis_hits = 0
+        # Bumped by invalidate() so Redis entries from older generations are ignored
+        self._redis_generation = 0
+
+    @staticmethod
+    def key(method: str, request, role: str = None) -> str:
+        payload = request.SerializeToString(deterministic=True)
+        digest = hashlib.sha1(payload).hexdigest()
+        return f"{method}:{role or ''}:{digest}"
+
+    def _redis_key(self, key: str) -> str:
+        return f"{self.REDIS_PREFIX}:{self._redis_generation}:{key}"
+
+    async def get(self, key: str, response_type):
+        value = self.local.get(key)
+        if value is None and self.use_redis:
+            value = await self._redis_get(key)
+            if value is not None:
+                self.redis_hits += 1
+                self.local.set(key, value)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return response_type.FromString(value)
+
+    async def set(self, key: str, response):
+        value = response.SerializeToString()
+        self.local.set(key, value)
+        if self.use_redis:
+            redis_client = get_redis_client()
+            if redis_client:
+                try:
+                    await redis_client.set(self._redis_key(key), base64.b64encode(value).decode(), ex=self.ttl)
+                except Exception as e:
+                    logger.warning(f"Failed to write gRPC cache entry to Redis: {e}")
+
+    async def _redis_get(self, key: str) -> Optional[bytes]:
+        redis_client = get_redis_client()
+        if not redis_client:
+            return None
+        try:
+            await self._sync_generation(redis_client)
+            value = await redis_client.get(self._redis_key(key))
+            return base64.b64decode(value) if value is not None else None
+        except Exception as e:
+            logger.warning(f"Failed to read gRPC cache entry from Redis: {e}")
+            return None
+
+    async def _sync_generation(self, redis_client):
+        generation = int(await redis_client.get(f"{self.REDIS_PREFIX}:generation") or 0)
+        if generation != self._redis_generation:
+            # Another process invalidated; drop our local copies too
+            self._redis_generation = generation
+            self.local.clear()
+
+    async def invalidate(self, method: str = None):
+        """
+        手动失效：清空本进程缓存，并在启用Redis时让所有进程的二级缓存失效
+        Other processes drop their local tier the next time they consult Redis
+        """
+        self.local.clear(prefix=f"{method}:" if method else None)
+        if self.use_redis:
+            redis_client = get_redis_client()
+            if redis_client:
+                self._redis_generation = await redis_client.incr(f"{self.REDIS_PREFIX}:generation")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "redis_hits": self.redis_hits,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "size": len(self.local)
+        }
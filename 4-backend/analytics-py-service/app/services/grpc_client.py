@@ -1,36 +1,106 @@
+import asyncio
+import itertools
+import json
 import grpc
 import os
-from typing import Optional
+from typing import Dict, List, Optional
 import logging
 from app.proto import campus_pb2, campus_pb2_grpc
+from app.services.grpc_cache import ReferenceDataCache
+from app.services.metrics import GRPCMetricsInterceptor
 
 logger = logging.getLogger(__name__)
 
+GRPC_CHANNEL_POOL_SIZE = int(os.getenv('GRPC_CHANNEL_POOL_SIZE', 1))
+GRPC_DEADLINE_SECONDS = float(os.getenv('GRPC_DEADLINE_SECONDS', 3))
+# business-service runs grpc-go with the default keepalive policy (MinTime 5m, no pings without
+# streams): pinging more often or while idle is answered with GOAWAY too_many_pings
+GRPC_KEEPALIVE_TIME_MS = int(os.getenv('GRPC_KEEPALIVE_TIME_MS', 300000))
+GRPC_KEEPALIVE_TIMEOUT_MS = int(os.getenv('GRPC_KEEPALIVE_TIMEOUT_MS', 10000))
+GRPC_MAX_ATTEMPTS = int(os.getenv('GRPC_MAX_ATTEMPTS', 3))
+GRPC_COALESCE_STATS = os.getenv('GRPC_COALESCE_STATS', 'true').lower() == 'true'
+GRPC_CACHE_ENABLED = os.getenv('GRPC_CACHE_ENABLED', 'true').lower() == 'true'
+
+# 重试策略通过service config下发，只对幂等的查询接口生效
+SERVICE_CONFIG = {
+    "methodConfig": [{
+        "name": [{"service": "campus.CampusService"}],
+        "retryPolicy": {
+            "maxAttempts": GRPC_MAX_ATTEMPTS,
+            "initialBackoff": "0.1s",
+            "maxBackoff": "1s",
+            "backoffMultiplier": 2,
+            "retryableStatusCodes": ["UNAVAILABLE", "RESOURCE_EXHAUSTED"]
+        }
+    }]
+}
+
+CHANNEL_OPTIONS = [
+    ('grpc.keepalive_time_ms', GRPC_KEEPALIVE_TIME_MS),
+    ('grpc.keepalive_timeout_ms', GRPC_KEEPALIVE_TIMEOUT_MS),
+    ('grpc.keepalive_permit_without_calls', 0),
+    ('grpc.enable_retries', 1),
+    ('grpc.service_config', json.dumps(SERVICE_CONFIG)),
+    # 每个channel使用独立的subchannel，连接池才能真正分摊到多条HTTP/2连接
+    ('grpc.use_local_subchannel_pool', 1),
+]
+
 class GRPCClient:
-    """gRPC客户端，用于连接business-service"""
-    
-    def __init__(self):
-        self.channel: Optional[grpc.Channel] = None
+    """gRPC客户端，用于连接business-service（基于grpc.aio，不阻塞事件循环）"""
+
+    def __init__(self, pool_size: int = GRPC_CHANNEL_POOL_SIZE):
+        self.pool_size = max(1, pool_size)
+        self.channels: List[grpc.aio.Channel] = []
         self.campus_stub: Optional[campus_pb2_grpc.CampusServiceStub] = None
+        self._stubs: List[campus_pb2_grpc.CampusServiceStub] = []
+        self._next_stub = None
+        self._inflight_stats: Dict[tuple, asyncio.Future] = {}
+        self.cache: Optional[ReferenceDataCache] = ReferenceDataCache() if GRPC_CACHE_ENABLED else None
         self.business_service_url = os.getenv('BUSINESS_GRPC_URL', 'business-service:9090')
-    
-    def connect(self):
+
+    async def connect(self):
         """连接到business-service"""
+        if self.channels:
+            return
         try:
-            self.channel = grpc.insecure_channel(self.business_service_url)
-            self.campus_stub = campus_pb2_grpc.CampusServiceStub(self.channel)
-            logger.info(f"Connected to business-service at {self.business_service_url}")
+            self.channels = [
+                grpc.aio.insecure_channel(
+                    self.business_service_url,
+                    options=CHANNEL_OPTIONS,
+                    interceptors=[GRPCMetricsInterceptor()]
+                )
+                for _ in range(self.pool_size)
+            ]
+            self._stubs = [campus_pb2_grpc.CampusServiceStub(channel) for channel in self.channels]
+            self._next_stub = itertools.cycle(self._stubs)
+            self.campus_stub = self._stubs[0]
+            logger.info(f"Connected to business-service at {self.business_service_url} "
+                        f"with {self.pool_size} channel(s)")
         except Exception as e:
             logger.error(f"Failed to connect to business-service: {e}")
             raise
-    
-    def close(self):
+
+    async def close(self):
         """关闭连接"""
-        if self.channel:
-            self.channel.close()
+        if self.channels:
+            await asyncio.gather(*(channel.close() for channel in self.channels))
+            self.channels = []
+            self._stubs = []
+            self.campus_stub = None
             logger.info("Closed gRPC connection to business-service")
-    
-    def _add_user_metadata(self, user_id: str = None, user_role: str = None, 
+
+    async def invalidate_cache(self, method: str = None):
+        """手动失效参考数据缓存（如课程目录更新后）"""
+        if self.cache:
+            await self.cache.invalidate(method)
+
+    def _stub(self) -> campus_pb2_grpc.CampusServiceStub:
+        """轮询选择channel"""
+        if not self._stubs:
+            raise Exception("gRPC client not connected")
+        return next(self._next_stub)
+
+    def _add_user_metadata(self, user_id: str = None, user_role: str = None,
                           user_name: str = None, user_email: str = None):
         """添加用户元数据到gRPC调用"""
         metadata = []
@@ -43,19 +113,19 @@ class GRPCClient:
         if user_email:
             metadata.append(('x-user-email', user_email))
         return metadata
-    
+
     # 注意：用户和学生数据现在存储在MongoDB中，不再通过gRPC获取
-    
+
     # 课程相关方法
     async def get_courses(self, college_id: int = None, major_id: int = None,
                          course_type: str = None, semester_type: str = None,
                          page: int = 1, limit: int = 10, search: str = None,
                          requesting_user_id: str = None,
-                         requesting_user_role: str = None) -> campus_pb2.GetCoursesResponse:
+                         requesting_user_role: str = None,
+                         timeout: float = None) -> campus_pb2.GetCoursesResponse:
         """获取课程列表"""
-        if not self.campus_stub:
-            raise Exception("gRPC client not connected")
-        
+        stub = self._stub()
+
         request = campus_pb2.GetCoursesRequest(
             college_id=college_id or 0,
             major_id=major_id or 0,
@@ -66,34 +136,82 @@ class GRPCClient:
             search=search or ""
         )
         metadata = self._add_user_metadata(requesting_user_id, requesting_user_role)
-        
+
+        cache_key = None
+        if self.cache:
+            cache_key = self.cache.key("GetCourses", request, requesting_user_role)
+            cached = await self.cache.get(cache_key, campus_pb2.GetCoursesResponse)
+            if cached is not None:
+                return cached
+
         try:
-            response = self.campus_stub.GetCourses(request, metadata=metadata)
+            response = await stub.GetCourses(
+                request, metadata=metadata, timeout=timeout or GRPC_DEADLINE_SECONDS
+            )
+            if cache_key and response.success:
+                await self.cache.set(cache_key, response)
             return response
         except grpc.RpcError as e:
             logger.error(f"gRPC error getting courses: {e}")
             raise
-    
+
     # 统计相关方法
     async def get_stats(self, stats_type: str, period: str = "daily",
                        requesting_user_id: str = None,
-                       requesting_user_role: str = None) -> campus_pb2.GetStatsResponse:
-        """获取系统统计数据"""
-        if not self.campus_stub:
-            raise Exception("gRPC client not connected")
-        
+                       requesting_user_role: str = None,
+                       timeout: float = None) -> campus_pb2.GetStatsResponse:
+        """获取系统统计数据（带缓存，相同的并发请求合并为一次调用）"""
+        cache_key = None
+        if self.cache:
+            request = campus_pb2.GetStatsRequest(type=stats_type, period=period)
+            cache_key = self.cache.key("GetStats", request, requesting_user_role)
+            cached = await self.cache.get(cache_key, campus_pb2.GetStatsResponse)
+            if cached is not None:
+                return cached
+
+        response = await self._coalesced_stats(stats_type, period, requesting_user_id,
+                                               requesting_user_role, timeout)
+        if cache_key and response.success:
+            await self.cache.set(cache_key, response)
+        return response
+
+    async def _coalesced_stats(self, stats_type: str, period: str,
+                              requesting_user_id: str, requesting_user_role: str,
+                              timeout: float = None) -> campus_pb2.GetStatsResponse:
+        if not GRPC_COALESCE_STATS:
+            return await self._fetch_stats(stats_type, period, requesting_user_id,
+                                           requesting_user_role, timeout)
+
+        key = (stats_type, period, requesting_user_id, requesting_user_role)
+        inflight = self._inflight_stats.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        task = asyncio.ensure_future(self._fetch_stats(stats_type, period, requesting_user_id,
+                                                       requesting_user_role, timeout))
+        self._inflight_stats[key] = task
+        task.add_done_callback(lambda _: self._inflight_stats.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _fetch_stats(self, stats_type: str, period: str,
+                          requesting_user_id: str, requesting_user_role: str,
+                          timeout: float = None) -> campus_pb2.GetStatsResponse:
+        stub = self._stub()
+
         request = campus_pb2.GetStatsRequest(
             type=stats_type,
             period=period
         )
         metadata = self._add_user_metadata(requesting_user_id, requesting_user_role)
-        
+
         try:
-            response = self.campus_stub.GetStats(request, metadata=metadata)
+            response = await stub.GetStats(
+                request, metadata=metadata, timeout=timeout or GRPC_DEADLINE_SECONDS
+            )
             return response
         except grpc.RpcError as e:
             logger.error(f"gRPC error getting stats: {e}")
             raise
 
 # 全局gRPC客户端实例
-grpc_client = GRPCClient()
\ No newline at end of file
+grpc_client = GRPCClient()
@@ -0,0 +1,157 @@
+import asyncio
+import os
+from typing import List, Optional, Set
+import logging
+from pymongo.errors import BulkWriteError
+
+from app.services.cache import bump_generation
+from app.services.cardinality import record_events
+from app.services.live_updates import publish_events
+from app.services.event_queue import enqueue_events, process_inline
+from app.services.event_store import timeseries_storage
+from app.services.metrics import INGEST_BUFFER_DEPTH, INGEST_BUFFER_EVENTS, INGEST_FLUSH_SIZE
+from app.tasks.data_processing import insert_events, process_data_events
+
+logger = logging.getLogger(__name__)
+
+# "direct" inserts each event in the request, "buffered" answers 202 and
+# group-commits from an in-process buffer
+INGEST_MODE = os.getenv("INGEST_MODE", "direct")
+INGEST_BUFFER_MAX_EVENTS = int(os.getenv("INGEST_BUFFER_MAX_EVENTS", 10000))
+INGEST_FLUSH_BATCH_SIZE = int(os.getenv("INGEST_FLUSH_BATCH_SIZE", 500))
+INGEST_FLUSH_INTERVAL_MS = int(os.getenv("INGEST_FLUSH_INTERVAL_MS", 50))
+INGEST_RETRY_AFTER_SECONDS = 1
+
+DUPLICATE_KEY = 11000
+
+def buffered_ingestion() -> bool:
+    return INGEST_MODE == "buffered"
+
+class BufferFull(Exception):
+    pass
+
+class IngestBuffer:
+    """
+    Write-behind缓冲：请求只做校验和入队，后台协程每N条或每T毫秒用一次insert_many提交
+    Accepted events live only in this process until flushed, so a crash loses
+    at most one flush interval (or a backlog while Mongo is unavailable)
+    """
+
+    def __init__(self, max_events: int = INGEST_BUFFER_MAX_EVENTS,
+                 batch_size: int = INGEST_FLUSH_BATCH_SIZE,
+                 interval_ms: int = INGEST_FLUSH_INTERVAL_MS):
+        self.max_events = max_events
+        self.batch_size = batch_size
+        self.interval = interval_ms / 1000
+        self.db = None
+        self.redis_client = None
+        self._events: List[dict] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._processing: Set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def start(self, db, redis_client):
+        if self._task is not None:
+            return
+        self.db = db
+        self.redis_client = redis_client
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Buffered ingestion enabled (batch {self.batch_size}, "
+                    f"interval {self.interval * 1000:.0f}ms, capacity {self.max_events})")
+
+    def add(self, event: dict):
+        """Queue one validated event; raises BufferFull so the route can answer 429"""
+        if self._task is None:
+            raise RuntimeError("Ingest buffer is not running")
+        if len(self._events) >= self.max_events:
+            INGEST_BUFFER_EVENTS.labels("rejected").inc()
+            raise BufferFull(f"Ingest buffer is full ({self.max_events} events)")
+        self._events.append(event)
+        INGEST_BUFFER_DEPTH.set(len(self._events))
+        if len(self._events) >= self.batch_size:
+            self._wake.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Events stay buffered; the next tick retries and the bounded
+                # buffer turns a longer outage into 429s
+                logger.error(f"Buffered ingestion flush failed: {e}")
+                await asyncio.sleep(self.interval)
+
+    async def flush(self):
+        while self._events:
+            batch = self._events[:self.batch_size]
+            del self._events[:len(batch)]
+            try:
+                inserted = await self._insert(batch)
+            except BaseException:
+                self._events[:0] = batch
+                raise
+            finally:
+                INGEST_BUFFER_DEPTH.set(len(self._events))
+            INGEST_FLUSH_SIZE.observe(len(batch))
+            if inserted:
+                await self._after_insert(inserted)
+
+    async def _insert(self, batch: List[dict]) -> List[dict]:
+        failed = set()
+        try:
+            await insert_events(self.db, batch)
+        except BulkWriteError as bwe:
+            for error in bwe.details.get("writeErrors", []):
+                # A duplicate _id means an earlier, interrupted flush already wrote it
+                # (time-series collections have no unique _id, so they can't tell)
+                if error.get("code") != DUPLICATE_KEY:
+                    failed.add(error["index"])
+                    logger.error(f"Dropping buffered event {batch[error['index']]['_id']}: "
+                                 f"{error.get('errmsg', 'write error')}")
+        inserted = [event for index, event in enumerate(batch) if index not in failed]
+        INGEST_BUFFER_EVENTS.labels("inserted").inc(len(inserted))
+        if failed:
+            INGEST_BUFFER_EVENTS.labels("failed").inc(len(failed))
+        return inserted
+
+    async def _after_insert(self, events: List[dict]):
+        # Same follow-up as a direct insert, once per group commit
+        if not timeseries_storage():
+            if process_inline():
+                task = asyncio.create_task(process_data_events([event["_id"] for event in events]))
+                self._processing.add(task)
+                task.add_done_callback(self._processing.discard)
+            await enqueue_events(self.redis_client, events)
+        await bump_generation(self.redis_client, [event["user_id"] for event in events])
+        await record_events(self.redis_client, events)
+        await publish_events(self.redis_client, events)
+
+    async def stop(self):
+        """Stop the flusher and commit whatever is still buffered"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Lost {len(self._events)} buffered events on shutdown: {e}")
+        if self._processing:
+            await asyncio.gather(*self._processing, return_exceptions=True)
+
+ingest_buffer = IngestBuffer()
\ No newline at end of file
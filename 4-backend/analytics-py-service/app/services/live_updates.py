@@ -0,0 +1,249 @@
+import asyncio
+import json
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set
+import logging
+
+from app.services.fast_json import dumps
+from app.services.metrics import LIVE_CLIENTS, LIVE_MESSAGES_DROPPED
+
+logger = logging.getLogger(__name__)
+
+LIVE_UPDATES = os.getenv("LIVE_UPDATES", "true").lower() == "true"
+LIVE_CHANNEL = "analytics:live"
+# Sliding window behind the per-type rates pushed with every update
+LIVE_RATE_WINDOW_MINUTES = int(os.getenv("LIVE_RATE_WINDOW_MINUTES", 5))
+LIVE_HEARTBEAT_SECONDS = float(os.getenv("LIVE_HEARTBEAT_SECONDS", 15))
+# Frames a client may fall behind by before new ones are dropped for it
+LIVE_CLIENT_QUEUE_SIZE = int(os.getenv("LIVE_CLIENT_QUEUE_SIZE", 100))
+LIVE_MAX_CLIENTS = int(os.getenv("LIVE_MAX_CLIENTS", 1000))
+LIVE_RECENT_EVENTS = 10
+
+MINUTE_FORMAT = "%Y%m%d%H%M"
+
+def _minute_key(user_id: str, minute: str) -> str:
+    return f"analytics:live:minute:{user_id}:{minute}"
+
+async def publish_events(redis_client, events: Iterable[dict]):
+    """
+    Announce freshly written events: bump the per-user, per-minute counters the
+    rate windows are seeded from and publish one message per user. Best effort
+    """
+    if not redis_client or not LIVE_UPDATES:
+        return
+    by_user: Dict[str, List[dict]] = {}
+    for event in events:
+        by_user.setdefault(event["user_id"], []).append(event)
+    if not by_user:
+        return
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for user_id, user_events in by_user.items():
+            minutes: Dict[str, Counter] = {}
+            for event in user_events:
+                minute = (event.get("timestamp") or datetime.utcnow()).strftime(MINUTE_FORMAT)
+                minutes.setdefault(minute, Counter())[event["event_type"]] += 1
+            for minute, counts in minutes.items():
+                for event_type, count in counts.items():
+                    pipe.hincrby(_minute_key(user_id, minute), event_type, count)
+                pipe.expire(_minute_key(user_id, minute), (LIVE_RATE_WINDOW_MINUTES + 1) * 60)
+            pipe.publish(LIVE_CHANNEL, dumps({
+                "user_id": user_id,
+                "minutes": {minute: dict(counts) for minute, counts in minutes.items()},
+                "events": [
+                    {"_id": event["_id"], "event_type": event["event_type"], "timestamp": event.get("timestamp")}
+                    for event in user_events[-LIVE_RECENT_EVENTS:]
+                ]
+            }))
+        await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to publish live updates: {e}")
+
+class SlidingWindow:
+    """每分钟按事件类型计数的滑动窗口"""
+
+    def __init__(self, minutes: int = LIVE_RATE_WINDOW_MINUTES):
+        self.minutes = minutes
+        self._counts: Dict[str, Counter] = {}
+
+    def labels(self, now: datetime) -> List[str]:
+        """Minutes in the window ending at `now`, newest first"""
+        return [(now - timedelta(minutes=offset)).strftime(MINUTE_FORMAT) for offset in range(self.minutes)]
+
+    def add(self, minute: str, counts: Dict[str, int]):
+        self._counts.setdefault(minute, Counter()).update(counts)
+
+    def seed(self, minute: str, counts: Dict[str, int]):
+        self._counts[minute] = Counter(counts)
+
+    def rates(self, now: Optional[datetime] = None) -> dict:
+        labels = self.labels(now or datetime.utcnow())
+        for minute in [minute for minute in self._counts if minute < labels[-1]]:
+            del self._counts[minute]
+        totals = Counter()
+        for minute in labels:
+            totals.update(self._counts.get(minute, {}))
+        return {
+            "window_minutes": self.minutes,
+            "total": sum(totals.values()),
+            "per_minute": round(sum(totals.values()) / self.minutes, 3),
+            "by_type": dict(totals)
+        }
+
+class LiveClient:
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=LIVE_CLIENT_QUEUE_SIZE)
+        self.dropped = 0
+
+    def push(self, frame: bytes):
+        # A slow consumer loses frames instead of growing memory or stalling the others
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            LIVE_MESSAGES_DROPPED.inc()
+
+class LiveHub:
+    """
+    实时推送中心：每个进程只用一个Redis订阅连接，在本地把消息分发给该用户的所有SSE客户端
+    """
+
+    def __init__(self):
+        self.redis_client = None
+        self._clients: Dict[str, Set[LiveClient]] = {}
+        self._windows: Dict[str, SlidingWindow] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self, redis_client):
+        if self._task is None and LIVE_UPDATES:
+            self.redis_client = redis_client
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(LIVE_CHANNEL)
+                while True:
+                    message = await pubsub.get_message(timeout=LIVE_HEARTBEAT_SECONDS)
+                    if message is not None:
+                        self._dispatch(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Live update subscription failed, resubscribing: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.close()
+
+    def _dispatch(self, data: str):
+        try:
+            message = json.loads(data)
+        except ValueError:
+            logger.warning("Ignoring malformed live update")
+            return
+        clients = self._clients.get(message.get("user_id"))
+        if not clients:
+            return
+        window = self._windows[message["user_id"]]
+        counts = Counter()
+        for minute, minute_counts in message.get("minutes", {}).items():
+            window.add(minute, minute_counts)
+            counts.update(minute_counts)
+        # Serialized once per message, however many tabs the user has open
+        frame = _frame("events", {
+            "counts": dict(counts),
+            "rates": window.rates(),
+            "recent_events": message.get("events", [])
+        })
+        for client in clients:
+            client.push(frame)
+
+    async def connect(self, user_id: str) -> Optional[LiveClient]:
+        if sum(len(clients) for clients in self._clients.values()) >= LIVE_MAX_CLIENTS:
+            return None
+        client = LiveClient(user_id)
+        seeding = user_id not in self._clients
+        if seeding:
+            self._clients[user_id] = set()
+            self._windows[user_id] = SlidingWindow()
+        # Registered before any await, so a concurrent disconnect of another
+        # client of this user cannot drop the entry from under us
+        self._clients[user_id].add(client)
+        LIVE_CLIENTS.inc()
+        if seeding:
+            try:
+                # Minutes read from Redis replace what was dispatched meanwhile;
+                # the counters already include those updates
+                await self._seed(user_id, self._windows[user_id])
+            except BaseException:
+                self.disconnect(client)
+                raise
+        return client
+
+    async def _seed(self, user_id: str, window: SlidingWindow):
+        minutes = window.labels(datetime.utcnow())
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for minute in minutes:
+                pipe.hgetall(_minute_key(user_id, minute))
+            results = await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to seed live rates for {user_id}: {e}")
+            return
+        for minute, counts in zip(minutes, results):
+            if counts:
+                window.seed(minute, {event_type: int(count) for event_type, count in counts.items()})
+
+    def disconnect(self, client: LiveClient):
+        """Release a client's slot; safe to call more than once"""
+        clients = self._clients.get(client.user_id)
+        if clients is None or client not in clients:
+            return
+        clients.discard(client)
+        LIVE_CLIENTS.dec()
+        if not clients:
+            del self._clients[client.user_id]
+            del self._windows[client.user_id]
+
+    async def stream(self, client: LiveClient) -> AsyncIterator[bytes]:
+        """SSE frames for one client: a snapshot, then updates and heartbeats"""
+        try:
+            yield _frame("snapshot", {"rates": self._windows[client.user_id].rates()})
+            while True:
+                try:
+                    frame = await asyncio.wait_for(client.queue.get(), timeout=LIVE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": heartbeat\n\n"
+                    continue
+                if client.dropped:
+                    # Tell the client it missed updates so it can refetch the dashboard
+                    yield _frame("dropped", {"count": client.dropped})
+                    client.dropped = 0
+                yield frame
+        finally:
+            # The route also releases the slot in a background task, which runs
+            # even when this generator was never started
+            self.disconnect(client)
+
+def _frame(event: str, data: dict) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + dumps(data) + b"\n\n"
+
+live_hub = LiveHub()
\ No newline at end of file
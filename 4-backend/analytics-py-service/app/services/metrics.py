@@ -0,0 +1,191 @@
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Dict, Tuple
+import logging
+import grpc
+from prometheus_client import Counter, Gauge, Histogram
+from pymongo import monitoring
+from redis.asyncio import Redis
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "analytics_http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS
+)
+MONGO_COMMAND_DURATION = Histogram(
+    "analytics_mongo_command_duration_seconds",
+    "MongoDB command latency",
+    ["collection", "command", "outcome"],
+    buckets=LATENCY_BUCKETS
+)
+REDIS_COMMAND_DURATION = Histogram(
+    "analytics_redis_command_duration_seconds",
+    "Redis command latency",
+    ["command"],
+    buckets=LATENCY_BUCKETS
+)
+GRPC_CALL_DURATION = Histogram(
+    "analytics_grpc_call_duration_seconds",
+    "business-service gRPC call latency",
+    ["method", "code"],
+    buckets=LATENCY_BUCKETS
+)
+QUERY_BUDGET_TRIPS = Counter(
+    "analytics_query_budget_trips_total",
+    "Queries stopped by their time/size budget or a client disconnect",
+    ["route", "reason"]
+)
+EVENT_QUEUE_LENGTH = Gauge(
+    "analytics_event_queue_length",
+    "Entries in the data events stream"
+)
+EVENT_QUEUE_PENDING = Gauge(
+    "analytics_event_queue_pending",
+    "Entries delivered to the consumer group but not yet acknowledged"
+)
+EVENT_QUEUE_OLDEST_PENDING_AGE = Gauge(
+    "analytics_event_queue_oldest_pending_age_seconds",
+    "Age of the oldest unacknowledged stream entry"
+)
+INLINE_PROCESSING_INFLIGHT = Gauge(
+    "analytics_inline_processing_jobs_inflight",
+    "Event processing background tasks running in this process"
+)
+INGEST_BUFFER_DEPTH = Gauge(
+    "analytics_ingest_buffer_depth",
+    "Events accepted with 202 and waiting for the next group commit"
+)
+INGEST_BUFFER_EVENTS = Counter(
+    "analytics_ingest_buffer_events_total",
+    "Buffered ingestion outcomes (inserted, failed, rejected)",
+    ["outcome"]
+)
+INGEST_FLUSH_SIZE = Histogram(
+    "analytics_ingest_flush_size",
+    "Events written per buffered group commit",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+EVENT_PROCESSING_LAG = Histogram(
+    "analytics_event_processing_lag_seconds",
+    "Time from event creation to its processing commit",
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900)
+)
+EVENT_LOOP_LAG = Histogram(
+    "analytics_event_loop_lag_seconds",
+    "Delay of a periodic event-loop tick beyond its scheduled time",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+LIVE_CLIENTS = Gauge(
+    "analytics_live_clients",
+    "Server-Sent Events clients connected to this process"
+)
+LIVE_MESSAGES_DROPPED = Counter(
+    "analytics_live_messages_dropped_total",
+    "Live update frames dropped for clients too slow to read them"
+)
+
+EVENT_LOOP_CHECK_INTERVAL = float(os.getenv("EVENT_LOOP_CHECK_INTERVAL", 0.25))
+EVENT_LOOP_BLOCK_WARN_SECONDS = float(os.getenv("EVENT_LOOP_BLOCK_WARN_SECONDS", 0.1))
+QUEUE_METRICS_INTERVAL = float(os.getenv("QUEUE_METRICS_INTERVAL", 15))
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Mongo命令耗时，按集合和命令统计"""
+
+    def __init__(self):
+        self._collections: Dict[Tuple, str] = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = "-"
+        self._collections[(event.connection_id, event.request_id)] = collection
+
+    def _observe(self, event, outcome: str):
+        collection = self._collections.pop((event.connection_id, event.request_id), "-")
+        MONGO_COMMAND_DURATION.labels(collection, event.command_name, outcome).observe(
+            event.duration_micros / 1e6
+        )
+
+    def succeeded(self, event):
+        self._observe(event, "success")
+
+    def failed(self, event):
+        self._observe(event, "failure")
+
+mongo_command_listener = MongoCommandListener()
+
+class InstrumentedRedis(Redis):
+    """Redis client that times every command it sends"""
+
+    async def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            command = str(args[0]).lower() if args else "-"
+            REDIS_COMMAND_DURATION.labels(command).observe(time.perf_counter() - start)
+
+class GRPCMetricsInterceptor(grpc.aio.UnaryUnaryClientInterceptor):
+    """gRPC调用耗时拦截器"""
+
+    async def intercept_unary_unary(self, continuation, client_call_details, request):
+        method = client_call_details.method
+        if isinstance(method, bytes):
+            method = method.decode()
+        method = method.rsplit("/", 1)[-1]
+        start = time.perf_counter()
+        call = await continuation(client_call_details, request)
+        try:
+            await call
+            code = "OK"
+        except grpc.RpcError as e:
+            code = e.code().name if e.code() else "UNKNOWN"
+        GRPC_CALL_DURATION.labels(method, code).observe(time.perf_counter() - start)
+        return call
+
+def observe_processing_lag(events):
+    # Event timestamps are naive UTC
+    now = datetime.utcnow()
+    for event in events:
+        timestamp = event.get("timestamp")
+        if isinstance(timestamp, datetime):
+            EVENT_PROCESSING_LAG.observe(max(0.0, (now - timestamp).total_seconds()))
+
+async def monitor_event_loop():
+    """Detect blocking calls: a tick that wakes up late means the loop was busy"""
+    loop = asyncio.get_running_loop()
+    while True:
+        scheduled = loop.time() + EVENT_LOOP_CHECK_INTERVAL
+        await asyncio.sleep(EVENT_LOOP_CHECK_INTERVAL)
+        lag = max(0.0, loop.time() - scheduled)
+        EVENT_LOOP_LAG.observe(lag)
+        if lag > EVENT_LOOP_BLOCK_WARN_SECONDS:
+            logger.warning(f"Event loop blocked for {lag * 1000:.0f}ms")
+
+async def monitor_event_queue(redis_client, stream: str, group: str):
+    """Sample stream length, pending count and the age of the oldest pending entry"""
+    while True:
+        try:
+            EVENT_QUEUE_LENGTH.set(await redis_client.xlen(stream))
+            summary = await redis_client.xpending(stream, group)
+            pending = summary.get("pending", 0) if summary else 0
+            EVENT_QUEUE_PENDING.set(pending)
+            oldest = summary.get("min") if pending else None
+            if oldest:
+                oldest_ms = int(str(oldest).split("-")[0])
+                EVENT_QUEUE_OLDEST_PENDING_AGE.set(max(0.0, time.time() - oldest_ms / 1000))
+            else:
+                EVENT_QUEUE_OLDEST_PENDING_AGE.set(0)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # The stream or group may not exist until the first event/worker
+            logger.debug(f"Could not sample event queue metrics: {e}")
+        await asyncio.sleep(QUEUE_METRICS_INTERVAL)
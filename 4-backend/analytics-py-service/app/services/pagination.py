@@ -0,0 +1,48 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+from bson import ObjectId
+
+# Keyset order for event listings; the compound indexes end in (timestamp, _id)
+EVENTS_SORT = [("timestamp", -1), ("_id", -1)]
+
+class InvalidCursor(ValueError):
+    pass
+
+def encode_cursor(event: dict) -> str:
+    """Opaque continuation token for the position just after this event"""
+    event_id = event["_id"]
+    payload = {
+        "t": event["timestamp"].isoformat(),
+        "i": str(event_id),
+        "o": isinstance(event_id, ObjectId)
+    }
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(token: str) -> Tuple[datetime, object]:
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        timestamp = datetime.fromisoformat(payload["t"])
+        event_id = ObjectId(payload["i"]) if payload.get("o") else payload["i"]
+        return timestamp, event_id
+    except Exception as e:
+        raise InvalidCursor(f"Invalid cursor: {e}")
+
+def after_cursor(query: dict, token: Optional[str]) -> dict:
+    """
+    Restrict a descending (timestamp, _id) listing to rows after the token,
+    which Mongo serves as an index range scan instead of skipping
+    """
+    if not token:
+        return query
+    timestamp, event_id = decode_cursor(token)
+    return {
+        **query,
+        "$or": [
+            {"timestamp": {"$lt": timestamp}},
+            {"timestamp": timestamp, "_id": {"$lt": event_id}}
+        ]
+    }
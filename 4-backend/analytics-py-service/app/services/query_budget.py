@@ -0,0 +1,111 @@
+import asyncio
+import os
+from typing import Awaitable, Dict, Optional
+import logging
+from fastapi import Request
+from pymongo.errors import ExecutionTimeout
+
+from app.services.metrics import QUERY_BUDGET_TRIPS
+
+logger = logging.getLogger(__name__)
+
+DISCONNECT_POLL_SECONDS = 0.1
+
+class BudgetExceeded(Exception):
+    """A query hit its time or size budget, or the client went away"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+class QueryBudget:
+    """
+    查询预算：服务端maxTimeMS、最大结果数、allowDiskUse策略
+    Each value can be overridden with QUERY_BUDGET_<NAME>_MAX_TIME_MS,
+    _MAX_RESULTS and _ALLOW_DISK_USE
+    """
+
+    def __init__(self, name: str, max_time_ms: int, max_results: int, allow_disk_use: bool = False):
+        prefix = f"QUERY_BUDGET_{name.upper()}"
+        self.name = name
+        self.max_time_ms = int(os.getenv(f"{prefix}_MAX_TIME_MS", max_time_ms))
+        self.max_results = int(os.getenv(f"{prefix}_MAX_RESULTS", max_results))
+        self.allow_disk_use = os.getenv(f"{prefix}_ALLOW_DISK_USE", str(allow_disk_use)).lower() == "true"
+
+    def trip(self, reason: str, status_code: int, detail: str) -> BudgetExceeded:
+        QUERY_BUDGET_TRIPS.labels(self.name, reason).inc()
+        logger.warning(f"Query budget '{self.name}' tripped ({reason}): {detail}")
+        return BudgetExceeded(status_code, detail)
+
+    def aggregate(self, collection, pipeline: list):
+        return collection.aggregate(
+            pipeline,
+            maxTimeMS=self.max_time_ms,
+            allowDiskUse=self.allow_disk_use
+        )
+
+    def find(self, cursor):
+        return cursor.max_time_ms(self.max_time_ms)
+
+    def check_size(self, count: int):
+        if count > self.max_results:
+            raise self.trip(
+                "max_results", 413,
+                f"Query result exceeds {self.max_results} documents; narrow the time range or grouping"
+            )
+
+    async def to_list(self, cursor, length: Optional[int] = None) -> list:
+        """Drain a cursor without ever holding more than max_results + 1 documents"""
+        cap = self.max_results + 1 if length is None else min(length, self.max_results + 1)
+        try:
+            documents = await cursor.to_list(length=cap)
+        except ExecutionTimeout:
+            raise self.timed_out()
+        if length is None:
+            self.check_size(len(documents))
+        return documents
+
+    async def count(self, collection, query: dict) -> int:
+        try:
+            return await collection.count_documents(query, maxTimeMS=self.max_time_ms)
+        except ExecutionTimeout:
+            raise self.timed_out()
+
+    def timed_out(self) -> BudgetExceeded:
+        return self.trip(
+            "max_time", 504,
+            f"Query exceeded its {self.max_time_ms}ms time budget"
+        )
+
+QUERY_BUDGETS: Dict[str, QueryBudget] = {
+    "events": QueryBudget("events", max_time_ms=2000, max_results=1000),
+    "dashboard": QueryBudget("dashboard", max_time_ms=3000, max_results=1000),
+    "query": QueryBudget("query", max_time_ms=5000, max_results=10000, allow_disk_use=True),
+    "export": QueryBudget("export", max_time_ms=30000, max_results=100000, allow_disk_use=True),
+    # Column loads for the NumPy engine: rows pulled, not results returned
+    "engine": QueryBudget("engine", max_time_ms=15000, max_results=2000000),
+}
+
+def get_budget(name: str) -> QueryBudget:
+    return QUERY_BUDGETS[name]
+
+async def cancel_on_disconnect(request: Request, awaitable: Awaitable, budget: QueryBudget):
+    """
+    Await the work but abandon it as soon as the HTTP client disconnects;
+    the server-side operation itself is still bounded by maxTimeMS
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                raise budget.trip("client_disconnected", 499, "Client closed request")
+    except ExecutionTimeout:
+        raise budget.timed_out()
+    finally:
+        if not task.done():
+            task.cancel()
@@ -0,0 +1,216 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import logging
+
+from app.models.data_models import AnalyticsQuery
+from app.services.rollups import ROLLUPS_COLLECTION
+from app.services.event_store import events_collection_name, storage_pipeline
+
+logger = logging.getLogger(__name__)
+
+# Only these fields may be interpolated into $group
+GROUPABLE_FIELDS = {
+    "event_type": "$event_type",
+    "processed": "$processed",
+    "processed_data.category": "$processed_data.category",
+}
+BUCKETS = ("hour", "day", "week")
+AGGREGATIONS = ("count", "sum", "avg", "min", "max", "percentile")
+NUMERIC_FIELD = "$processed_data.numeric_value"
+
+# Result key per aggregation, kept compatible with the previous total/average keys
+RESULT_KEYS = {
+    "sum": "total",
+    "avg": "average",
+    "min": "min",
+    "max": "max",
+    "percentile": "percentile",
+}
+
+class QueryPlanError(ValueError):
+    pass
+
+class QueryPlan:
+    """Validated analytics query and the collection/pipeline chosen to answer it"""
+
+    def __init__(self, query: AnalyticsQuery, collection: str, pipeline: List[dict]):
+        self.query = query
+        self.collection = collection
+        self.pipeline = pipeline
+
+    @property
+    def source(self) -> str:
+        return "rollups" if self.collection == ROLLUPS_COLLECTION else "events"
+
+def _validate(query: AnalyticsQuery):
+    if query.mode != "aggregate":
+        raise QueryPlanError(f"Unsupported mode '{query.mode}' for the aggregation planner")
+    if query.aggregation not in AGGREGATIONS:
+        raise QueryPlanError(f"Unsupported aggregation '{query.aggregation}'. Available: {list(AGGREGATIONS)}")
+    if query.group_by and query.group_by not in GROUPABLE_FIELDS:
+        raise QueryPlanError(f"Cannot group by '{query.group_by}'. Available: {sorted(GROUPABLE_FIELDS)}")
+    if query.bucket and query.bucket not in BUCKETS:
+        raise QueryPlanError(f"Unsupported bucket '{query.bucket}'. Available: {list(BUCKETS)}")
+    if query.start_date and query.end_date and query.start_date > query.end_date:
+        raise QueryPlanError("start_date must not be after end_date")
+
+def _is_aligned(value: datetime, unit: str) -> bool:
+    if value.minute or value.second or value.microsecond:
+        return False
+    return unit == "hour" or not value.hour
+
+def _rollup_granularity(query: AnalyticsQuery) -> Optional[str]:
+    """
+    Rollups hold count and numeric sum/count per user x event_type x hour/day,
+    so they can answer count/sum/avg queries grouped by at most event_type and
+    a bucket, over windows that start on a bucket boundary and are open-ended
+    """
+    if query.aggregation not in ("count", "sum", "avg"):
+        return None
+    if query.group_by not in (None, "event_type"):
+        return None
+    if query.end_date is not None:
+        return None
+    granularity = "hour" if query.bucket == "hour" else "day"
+    if query.start_date and not _is_aligned(query.start_date, granularity):
+        return None
+    return granularity
+
+def _bucket_expr(field: str, unit: str) -> dict:
+    expr = {"date": field, "unit": unit}
+    if unit == "week":
+        expr["startOfWeek"] = "monday"
+    return {"$dateTrunc": expr}
+
+def _group_id(query: AnalyticsQuery, time_field: str) -> Any:
+    keys = {}
+    if query.group_by:
+        keys["group"] = GROUPABLE_FIELDS[query.group_by]
+    if query.bucket:
+        keys["bucket"] = _bucket_expr(time_field, query.bucket)
+    if not keys:
+        return None
+    if len(keys) == 1:
+        return next(iter(keys.values()))
+    return keys
+
+def _result_sort(query: AnalyticsQuery) -> dict:
+    if query.bucket and query.group_by:
+        return {"_id.bucket": 1, "count": -1}
+    if query.bucket:
+        return {"_id": 1}
+    return {"count": -1}
+
+def _events_pipeline(user_id: str, query: AnalyticsQuery) -> List[dict]:
+    # The $match leads with user_id/event_type/timestamp so it uses the compound indexes
+    match_criteria: Dict[str, Any] = {"user_id": user_id}
+    if query.event_types:
+        match_criteria["event_type"] = {"$in": query.event_types}
+    if query.start_date or query.end_date:
+        timestamp_filter = {}
+        if query.start_date:
+            timestamp_filter["$gte"] = query.start_date
+        if query.end_date:
+            timestamp_filter["$lte"] = query.end_date
+        match_criteria["timestamp"] = timestamp_filter
+
+    group_stage: Dict[str, Any] = {"_id": _group_id(query, "$timestamp"), "count": {"$sum": 1}}
+    project_stage = None
+    aggregation = query.aggregation
+    if aggregation in ("sum", "avg", "min", "max"):
+        group_stage[RESULT_KEYS[aggregation]] = {f"${aggregation}": NUMERIC_FIELD}
+    elif aggregation == "percentile":
+        # $percentile needs MongoDB 7; sort the collected values instead (5.2+)
+        rank = (query.percentile if query.percentile is not None else 50) / 100
+        group_stage["values"] = {"$push": NUMERIC_FIELD}
+        project_stage = {
+            "count": 1,
+            "percentile": {"$let": {
+                "vars": {"sorted": {"$sortArray": {
+                    "input": {"$filter": {"input": "$values", "cond": {"$isNumber": "$$this"}}},
+                    "sortBy": 1
+                }}},
+                "in": {"$arrayElemAt": [
+                    "$$sorted",
+                    {"$toInt": {"$floor": {"$multiply": [rank, {"$max": [{"$subtract": [{"$size": "$$sorted"}, 1]}, 0]}]}}}
+                ]}
+            }}
+        }
+
+    results_branch = [{"$group": group_stage}]
+    if project_stage:
+        results_branch.append({"$project": project_stage})
+    results_branch.append({"$sort": _result_sort(query)})
+
+    return [
+        {"$match": match_criteria},
+        {"$facet": {
+            "results": results_branch,
+            "total": [{"$count": "count"}]
+        }}
+    ]
+
+def _rollups_pipeline(user_id: str, query: AnalyticsQuery, granularity: str) -> List[dict]:
+    match_criteria: Dict[str, Any] = {"user_id": user_id, "granularity": granularity}
+    if query.event_types:
+        match_criteria["event_type"] = {"$in": query.event_types}
+    if query.start_date:
+        match_criteria["bucket"] = {"$gte": query.start_date}
+
+    group_stage: Dict[str, Any] = {"_id": _group_id(query, "$bucket"), "count": {"$sum": "$count"}}
+    project_stage = None
+    if query.aggregation == "sum":
+        group_stage["total"] = {"$sum": "$numeric_sum"}
+    elif query.aggregation == "avg":
+        group_stage["numeric_sum"] = {"$sum": "$numeric_sum"}
+        group_stage["numeric_count"] = {"$sum": "$numeric_count"}
+        project_stage = {
+            "count": 1,
+            "average": {"$cond": [
+                {"$gt": ["$numeric_count", 0]},
+                {"$divide": ["$numeric_sum", "$numeric_count"]},
+                None
+            ]}
+        }
+
+    results_branch = [{"$group": group_stage}, {"$match": {"count": {"$gt": 0}}}]
+    if project_stage:
+        results_branch.append({"$project": project_stage})
+    results_branch.append({"$sort": _result_sort(query)})
+
+    return [
+        {"$match": match_criteria},
+        {"$facet": {
+            "results": results_branch,
+            "total": [{"$group": {"_id": None, "count": {"$sum": "$count"}}}]
+        }}
+    ]
+
+def plan_query(user_id: str, query: AnalyticsQuery, use_rollups: bool = True) -> QueryPlan:
+    _validate(query)
+    granularity = _rollup_granularity(query) if use_rollups else None
+    if granularity:
+        return QueryPlan(query, ROLLUPS_COLLECTION, _rollups_pipeline(user_id, query, granularity))
+    return QueryPlan(query, events_collection_name(), storage_pipeline(_events_pipeline(user_id, query)))
+
+async def execute_plan(db, plan: QueryPlan, budget=None) -> dict:
+    """Run the planned pipeline; results and total come back from one round trip"""
+    pipeline = plan.pipeline
+    if budget:
+        # Cap the grouped rows server-side; one extra row tells us the cap was hit
+        facet = dict(pipeline[-1]["$facet"])
+        facet["results"] = facet["results"] + [{"$limit": budget.max_results + 1}]
+        pipeline = pipeline[:-1] + [{"$facet": facet}]
+        cursor = budget.aggregate(db[plan.collection], pipeline)
+        facet = await budget.to_list(cursor, length=1)
+    else:
+        facet = await db[plan.collection].aggregate(pipeline).to_list(length=1)
+    facet = facet[0] if facet else {"results": [], "total": []}
+    if budget:
+        budget.check_size(len(facet["results"]))
+    total = facet["total"][0]["count"] if facet["total"] else 0
+    return {
+        "total_events": total,
+        "results": facet["results"],
+        "source": plan.source
+    }
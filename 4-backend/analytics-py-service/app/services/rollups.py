@@ -0,0 +1,198 @@
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from pymongo import UpdateOne
+import logging
+
+from app.services.event_store import events_collection, storage_pipeline
+
+logger = logging.getLogger(__name__)
+
+# Pre-aggregated counters per user x event_type x day/hour bucket
+ROLLUPS_COLLECTION = "event_rollups"
+GRANULARITIES = {
+    "day": "%Y-%m-%d",
+    "hour": "%Y-%m-%dT%H",
+}
+
+# Events still marked rollup_pending this long after processing are treated as
+# missed by a failed rollup write rather than as in flight
+ROLLUP_RECONCILE_GRACE_SECONDS = int(os.getenv("ROLLUP_RECONCILE_GRACE_SECONDS", 300))
+
+def _truncate(timestamp: datetime, granularity: str) -> datetime:
+    if granularity == "day":
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+def rollup_id(user_id: str, event_type: str, granularity: str, bucket: datetime) -> str:
+    return f"{user_id}|{event_type}|{granularity}|{bucket.strftime(GRANULARITIES[granularity])}"
+
+def rollup_operations(events: Iterable[dict], sign: int = 1) -> List[UpdateOne]:
+    """
+    Fold events in memory into one $inc upsert per rollup bucket
+    Events need user_id, event_type, timestamp and optionally processed_data
+    """
+    increments: Dict[Tuple[str, str, str, datetime], Dict[str, float]] = {}
+    for event in events:
+        timestamp = event.get("timestamp")
+        if not isinstance(timestamp, datetime):
+            continue
+        numeric_value = (event.get("processed_data") or {}).get("numeric_value")
+        for granularity in GRANULARITIES:
+            key = (event["user_id"], event["event_type"], granularity, _truncate(timestamp, granularity))
+            counters = increments.setdefault(key, {"count": 0, "numeric_sum": 0.0, "numeric_count": 0})
+            counters["count"] += sign
+            if numeric_value is not None:
+                counters["numeric_sum"] += sign * numeric_value
+                counters["numeric_count"] += sign
+
+    return [
+        UpdateOne(
+            {"_id": rollup_id(user_id, event_type, granularity, bucket)},
+            {
+                "$inc": counters,
+                "$setOnInsert": {
+                    "user_id": user_id,
+                    "event_type": event_type,
+                    "granularity": granularity,
+                    "bucket": bucket
+                }
+            },
+            upsert=True
+        )
+        for (user_id, event_type, granularity, bucket), counters in increments.items()
+    ]
+
+async def apply_rollups(db, events: List[dict], sign: int = 1):
+    """Apply rollup increments (or decrements with sign=-1) in one bulk_write"""
+    operations = rollup_operations(events, sign)
+    if operations:
+        await db[ROLLUPS_COLLECTION].bulk_write(operations, ordered=False)
+
+ROLLUP_DASHBOARD_SECTIONS = ("total_events", "event_breakdown", "time_series")
+
+async def get_rollup_dashboard(db, user_id: str, days: int = 7, sections: Iterable[str] = ROLLUP_DASHBOARD_SECTIONS,
+                               budget=None) -> dict:
+    """
+    Dashboard totals served from daily rollups, independent of raw event volume
+    All requested sections come from one $facet over a single $match
+    """
+    sections = set(sections) & set(ROLLUP_DASHBOARD_SECTIONS)
+    if not sections:
+        return {}
+
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    since = today - timedelta(days=days)
+
+    facets = {}
+    if "event_breakdown" in sections:
+        facets["event_breakdown"] = [
+            {"$group": {"_id": "$event_type", "count": {"$sum": "$count"}}},
+            {"$match": {"count": {"$gt": 0}}},
+            {"$sort": {"count": -1}}
+        ]
+    elif "total_events" in sections:
+        facets["total_events"] = [
+            {"$group": {"_id": None, "count": {"$sum": "$count"}}}
+        ]
+    if "time_series" in sections:
+        facets["time_series"] = [
+            {"$match": {"bucket": {"$gte": since}}},
+            {"$group": {"_id": "$bucket", "count": {"$sum": "$count"}}},
+            {"$match": {"count": {"$gt": 0}}},
+            {"$sort": {"_id": 1}}
+        ]
+
+    pipeline = [
+        {"$match": {"user_id": user_id, "granularity": "day"}},
+        {"$facet": facets}
+    ]
+    if budget:
+        cursor = budget.aggregate(db[ROLLUPS_COLLECTION], pipeline)
+    else:
+        cursor = db[ROLLUPS_COLLECTION].aggregate(pipeline)
+    facet_results = await cursor.to_list(length=1)
+    facet_results = facet_results[0] if facet_results else {}
+
+    result = {}
+    if "event_breakdown" in facet_results:
+        event_breakdown = {item["_id"]: item["count"] for item in facet_results["event_breakdown"]}
+        if "event_breakdown" in sections:
+            result["event_breakdown"] = event_breakdown
+        if "total_events" in sections:
+            result["total_events"] = sum(event_breakdown.values())
+    elif "total_events" in facet_results:
+        totals = facet_results["total_events"]
+        result["total_events"] = totals[0]["count"] if totals else 0
+    if "time_series" in sections:
+        result["time_series"] = {
+            item["_id"].strftime(GRANULARITIES["day"]): item["count"]
+            for item in facet_results.get("time_series", [])
+        }
+    return result
+
+def _backfill_pipeline(match: dict, granularity: str) -> list:
+    bucket_expr = {"$dateTrunc": {"date": "$timestamp", "unit": granularity}}
+    return [
+        {"$match": match},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "event_type": "$event_type", "bucket": bucket_expr},
+            "count": {"$sum": 1},
+            "numeric_sum": {"$sum": {"$ifNull": ["$processed_data.numeric_value", 0]}},
+            "numeric_count": {"$sum": {"$cond": [
+                {"$ne": [{"$type": "$processed_data.numeric_value"}, "missing"]}, 1, 0
+            ]}}
+        }},
+        {"$project": {
+            "_id": {"$concat": [
+                "$_id.user_id", "|", "$_id.event_type", f"|{granularity}|",
+                {"$dateToString": {"format": GRANULARITIES[granularity], "date": "$_id.bucket"}}
+            ]},
+            "user_id": "$_id.user_id",
+            "event_type": "$_id.event_type",
+            "granularity": granularity,
+            "bucket": "$_id.bucket",
+            "count": 1,
+            "numeric_sum": 1,
+            "numeric_count": 1
+        }},
+        {"$merge": {"into": ROLLUPS_COLLECTION, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}}
+    ]
+
+async def backfill_rollups(db, user_id: Optional[str] = None):
+    """
+    Rebuild rollups from processed raw events, server-side via $merge
+    Run while ingestion is paused (or processing is in worker mode and stopped)
+    to avoid racing live increments
+    """
+    match = {"processed": True}
+    scope = {}
+    if user_id:
+        match["user_id"] = user_id
+        scope["user_id"] = user_id
+
+    deleted = await db[ROLLUPS_COLLECTION].delete_many(scope)
+    logger.info(f"Removed {deleted.deleted_count} existing rollups")
+
+    for granularity in GRANULARITIES:
+        pipeline = storage_pipeline(_backfill_pipeline(match, granularity))
+        await events_collection(db).aggregate(pipeline, allowDiskUse=True).to_list(length=None)
+        logger.info(f"Rebuilt {granularity} rollups")
+
+async def reconcile_rollups(db, grace_seconds: int = ROLLUP_RECONCILE_GRACE_SECONDS) -> List[str]:
+    """
+    Rebuild the rollups of users whose events were marked processed but never
+    counted, i.e. whose apply_rollups failed after the processing write.
+    Rebuilding from processed events makes this safe to repeat. Returns the
+    rebuilt user ids
+    """
+    stale = {
+        "rollup_pending": True,
+        "processed_data.processed_at": {"$lt": datetime.utcnow() - timedelta(seconds=grace_seconds)}
+    }
+    user_ids = await db.events.distinct("user_id", stale)
+    for user_id in user_ids:
+        await backfill_rollups(db, user_id=user_id)
+        await db.events.update_many({**stale, "user_id": user_id}, {"$unset": {"rollup_pending": ""}})
+        logger.info(f"Reconciled rollups for {user_id}")
+    return user_ids
\ No newline at end of file
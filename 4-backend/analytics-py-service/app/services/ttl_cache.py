@@ -0,0 +1,38 @@
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+class TTLCache:
+    """进程内LRU+TTL缓存"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self, prefix: str = None):
+        if prefix is None:
+            self._data.clear()
+            return
+        for key in [key for key in self._data if key.startswith(prefix)]:
+            del self._data[key]
+
+    def __len__(self):
+        return len(self._data)
\ No newline at end of file
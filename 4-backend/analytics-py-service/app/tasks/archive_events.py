@@ -0,0 +1,118 @@
+"""
+Move expired events from `events` into compressed archive files, then delete them
+
+    python -m app.tasks.archive_events [--batch-size 1000] [--pause-ms 200]
+
+Events older than EVENTS_ARCHIVE_DAYS are read in (timestamp, _id) order in
+throttled batches and written under EVENTS_ARCHIVE_PATH as
+date=YYYY-MM-DD/shard=NN/part-*.ndjson.zst (gzip without zstandard). A batch
+is deleted only after its files are fsynced, and the position is checkpointed
+after every batch, so an interrupted run resumes where it stopped; a batch
+replayed after a crash rewrites the same file names instead of duplicating rows.
+Exports read the archive transparently for ranges that reach into it.
+"""
+import argparse
+import asyncio
+import os
+import logging
+from datetime import datetime
+from dotenv import load_dotenv
+
+# Before the app imports: their module-level settings read the environment
+load_dotenv()
+
+from app.config.connections import open_connections, close_connections
+from app.config.database import get_database
+from app.config.indexes import EVENTS_TTL_DAYS
+from app.config.redis_config import get_redis_client
+from app.services.archive import EVENTS_ARCHIVE_DAYS, archive_cutoff, archiving_enabled, write_batch
+from app.services.cache import bump_generation
+from app.services.event_store import timeseries_storage
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 1000))
+# Pause between batches so archiving never saturates Mongo or the disk
+ARCHIVE_PAUSE_MS = int(os.getenv("ARCHIVE_PAUSE_MS", 200))
+
+CHECKPOINTS_COLLECTION = "retention_checkpoints"
+CHECKPOINT_ID = "events_archive"
+
+def _expired(cutoff: datetime, checkpoint: dict) -> dict:
+    query = {"timestamp": {"$lt": cutoff}}
+    if checkpoint.get("last_timestamp") is None:
+        return query
+    last_timestamp, last_id = checkpoint["last_timestamp"], checkpoint["last_id"]
+    return {"$and": [query, {"$or": [
+        {"timestamp": {"$gt": last_timestamp}},
+        {"timestamp": last_timestamp, "_id": {"$gt": last_id}}
+    ]}]}
+
+async def archive_expired(db, redis_client=None, batch_size: int = ARCHIVE_BATCH_SIZE,
+                          pause_ms: int = ARCHIVE_PAUSE_MS) -> dict:
+    cutoff = archive_cutoff()
+    checkpoints = db[CHECKPOINTS_COLLECTION]
+    checkpoint = await checkpoints.find_one({"_id": CHECKPOINT_ID}) or {}
+    archived = checkpoint.get("archived", 0)
+    if checkpoint.get("last_timestamp") is not None:
+        logger.info(f"Resuming after {checkpoint['last_timestamp']} / {checkpoint['last_id']} "
+                    f"({archived} events archived so far)")
+
+    run_archived = 0
+    while True:
+        batch = await db.events.find(_expired(cutoff, checkpoint)) \
+            .sort([("timestamp", 1), ("_id", 1)]) \
+            .limit(batch_size) \
+            .to_list(length=batch_size)
+        if not batch:
+            break
+
+        first = batch[0]
+        name = f"part-{first['timestamp'].strftime('%Y%m%dT%H%M%S%f')}-{first['_id']}"
+        files = await asyncio.to_thread(write_batch, name, batch)
+        await db.events.delete_many({"_id": {"$in": [event["_id"] for event in batch]}})
+        await bump_generation(redis_client, [event["user_id"] for event in batch])
+
+        archived += len(batch)
+        run_archived += len(batch)
+        checkpoint = {
+            "last_timestamp": batch[-1]["timestamp"],
+            "last_id": batch[-1]["_id"],
+            "archived": archived,
+            "cutoff": cutoff,
+            "updated_at": datetime.utcnow()
+        }
+        await checkpoints.update_one({"_id": CHECKPOINT_ID}, {"$set": checkpoint}, upsert=True)
+        logger.info(f"Archived {len(batch)} events into {len(files)} files (up to {batch[-1]['timestamp']})")
+
+        if pause_ms:
+            await asyncio.sleep(pause_ms / 1000)
+
+    return {"archived": run_archived, "total_archived": archived, "cutoff": cutoff}
+
+async def main(batch_size: int, pause_ms: int):
+    if not archiving_enabled():
+        print("EVENTS_ARCHIVE_DAYS is not set; nothing to archive")
+        return
+    if timeseries_storage():
+        print("Events use time-series storage and expire through its retention; nothing to archive")
+        return
+    if EVENTS_TTL_DAYS and EVENTS_TTL_DAYS <= EVENTS_ARCHIVE_DAYS:
+        logger.warning(f"EVENTS_TTL_DAYS={EVENTS_TTL_DAYS} deletes events before they reach "
+                       f"EVENTS_ARCHIVE_DAYS={EVENTS_ARCHIVE_DAYS}; they will not be archived")
+
+    await open_connections()
+    try:
+        result = await archive_expired(get_database(), get_redis_client(), batch_size, pause_ms)
+        print(f"Archived {result['archived']} events older than {result['cutoff']} "
+              f"({result['total_archived']} in total)")
+    finally:
+        await close_connections()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Archive expired events to compressed files")
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--pause-ms", type=int, default=ARCHIVE_PAUSE_MS)
+    args = parser.parse_args()
+    asyncio.run(main(args.batch_size, args.pause_ms))
\ No newline at end of file
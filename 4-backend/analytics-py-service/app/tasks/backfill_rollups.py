@@ -0,0 +1,42 @@
+"""
+Rebuild the event rollup collection from raw events
+
+    python -m app.tasks.backfill_rollups [--user-id USER_ID | --pending]
+
+--pending only rebuilds users with events left out of the rollups by a failed
+rollup write; the worker does this on its own, inline and change stream
+deployments should schedule it
+"""
+import argparse
+import asyncio
+import logging
+from dotenv import load_dotenv
+
+# Before the app imports: their module-level settings read the environment
+load_dotenv()
+
+from app.config.connections import open_connections, close_connections
+from app.config.database import get_database
+from app.config.redis_config import get_redis_client
+from app.services.cache import bump_generation
+from app.services.rollups import backfill_rollups, reconcile_rollups
+
+async def main(user_id: str = None, pending: bool = False):
+    await open_connections(use_redis=pending)
+    db = get_database()
+    try:
+        if pending:
+            await bump_generation(get_redis_client(), await reconcile_rollups(db))
+        else:
+            await backfill_rollups(db, user_id=user_id)
+    finally:
+        await close_connections()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Rebuild event rollups from raw events")
+    scope = parser.add_mutually_exclusive_group()
+    scope.add_argument("--user-id", help="Only rebuild rollups for this user")
+    scope.add_argument("--pending", action="store_true", help="Only rebuild users with uncounted events")
+    args = parser.parse_args()
+    asyncio.run(main(args.user_id, args.pending))
@@ -0,0 +1,174 @@
+"""
+Change-stream event processor
+
+Tails inserts on `events`, batches them by count or time window and processes
+them with the same classification and rollup path as the other modes. The
+resume token is persisted after every committed batch, so a restart continues
+right after the last processed change:
+
+    EVENT_PROCESSING_MODE=change_stream python -m app.tasks.change_stream
+
+Needs MongoDB running as a replica set (change streams are not available on a
+standalone server). The polling path (process_events_async) only runs to
+catch up: on first start, and when the saved token has fallen off the oplog.
+"""
+import asyncio
+import os
+import signal
+import logging
+from datetime import datetime
+from typing import List, Optional
+from dotenv import load_dotenv
+from prometheus_client import start_http_server
+from pymongo.errors import OperationFailure, PyMongoError
+
+# Before the app imports: their module-level settings read the environment
+load_dotenv()
+
+from app.config.connections import open_connections, close_connections
+from app.config.database import get_database
+from app.services.event_store import timeseries_storage
+from app.services.metrics import monitor_event_loop
+from app.tasks.data_processing import PROCESSING_PROJECTION, process_event_documents, process_events_async
+
+logger = logging.getLogger(__name__)
+
+CHANGE_STREAM_BATCH_SIZE = int(os.getenv("CHANGE_STREAM_BATCH_SIZE", 500))
+# Longest a change waits in a partial batch before it is processed
+CHANGE_STREAM_MAX_WAIT_MS = int(os.getenv("CHANGE_STREAM_MAX_WAIT_MS", 200))
+# How often an idle stream still records its position
+CHANGE_STREAM_IDLE_CHECKPOINT_S = int(os.getenv("CHANGE_STREAM_IDLE_CHECKPOINT_S", 10))
+CHANGE_STREAM_METRICS_PORT = int(os.getenv("CHANGE_STREAM_METRICS_PORT", 9102))
+
+CHECKPOINTS_COLLECTION = "change_stream_checkpoints"
+CHECKPOINT_ID = "events"
+
+# Server codes meaning the saved token can't be resumed from
+# (InvalidResumeToken, ChangeStreamFatalError, ChangeStreamHistoryLost)
+UNRESUMABLE_CODES = {260, 280, 286}
+
+# Only inserts of unprocessed events, trimmed to the fields processing needs
+WATCH_PIPELINE = [
+    {"$match": {"operationType": "insert", "fullDocument.processed": False}},
+    {"$project": {
+        "documentKey": 1,
+        **{f"fullDocument.{field}": 1 for field in PROCESSING_PROJECTION}
+    }}
+]
+
+class ChangeStreamProcessor:
+    """基于change stream的事件处理器，按数量/时间窗口批处理，持久化resume token"""
+
+    def __init__(self, db, batch_size: int = CHANGE_STREAM_BATCH_SIZE,
+                 max_wait_ms: int = CHANGE_STREAM_MAX_WAIT_MS):
+        self.db = db
+        self.batch_size = batch_size
+        self.max_wait_ms = max_wait_ms
+        self._stopping = asyncio.Event()
+
+    async def load_token(self) -> Optional[dict]:
+        checkpoint = await self.db[CHECKPOINTS_COLLECTION].find_one({"_id": CHECKPOINT_ID})
+        return checkpoint.get("resume_token") if checkpoint else None
+
+    async def save_token(self, token: Optional[dict]):
+        await self.db[CHECKPOINTS_COLLECTION].update_one(
+            {"_id": CHECKPOINT_ID},
+            {"$set": {"resume_token": token, "updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+
+    async def catch_up(self):
+        """Process the backlog through the polling path"""
+        processed = await process_events_async(db=self.db)
+        logger.info(f"Catch-up processed {processed} events")
+
+    async def commit(self, changes: List[dict], token: dict):
+        events = []
+        for change in changes:
+            event = change["fullDocument"]
+            event["_id"] = change["documentKey"]["_id"]
+            events.append(event)
+        processed = await process_event_documents(self.db, events)
+        # Saved only after the writes, so a crash replays the batch; the
+        # processed=False guard and run_id keep the replay from double counting
+        await self.save_token(token)
+        logger.debug(f"Processed {processed} of {len(events)} streamed events")
+
+    async def consume(self, resume_token: Optional[dict]):
+        async with self.db.events.watch(
+            WATCH_PIPELINE,
+            resume_after=resume_token,
+            max_await_time_ms=self.max_wait_ms,
+            batch_size=self.batch_size
+        ) as stream:
+            if resume_token is None:
+                # The stream is open, so anything inserted from here on is seen
+                # by it; everything before is picked up by the polling path
+                await self.save_token(stream.resume_token)
+                await self.catch_up()
+
+            loop = asyncio.get_running_loop()
+            batch: List[dict] = []
+            deadline = 0.0
+            next_idle_checkpoint = loop.time() + CHANGE_STREAM_IDLE_CHECKPOINT_S
+            while not self._stopping.is_set():
+                change = await stream.try_next()
+                if change is not None:
+                    if not batch:
+                        deadline = loop.time() + self.max_wait_ms / 1000
+                    batch.append(change)
+                if batch and (change is None or len(batch) >= self.batch_size or loop.time() >= deadline):
+                    await self.commit(batch, stream.resume_token)
+                    batch = []
+                elif change is None and loop.time() >= next_idle_checkpoint:
+                    # Idle: still advance the token so a restart skips unrelated oplog
+                    await self.save_token(stream.resume_token)
+                    next_idle_checkpoint = loop.time() + CHANGE_STREAM_IDLE_CHECKPOINT_S
+            if batch:
+                await self.commit(batch, stream.resume_token)
+
+    async def run(self):
+        logger.info("Change stream processor watching events")
+        while not self._stopping.is_set():
+            try:
+                await self.consume(await self.load_token())
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if e.code in UNRESUMABLE_CODES:
+                    logger.warning(f"Saved resume token is no longer usable, catching up by polling: {e}")
+                    await self.save_token(None)
+                else:
+                    logger.error(f"Change stream failed: {e}")
+                    await asyncio.sleep(1)
+            except PyMongoError as e:
+                logger.error(f"Change stream interrupted, resuming: {e}")
+                await asyncio.sleep(1)
+
+    def stop(self):
+        self._stopping.set()
+
+async def main():
+    logging.basicConfig(level=logging.INFO)
+    if timeseries_storage():
+        logger.info("Events use time-series storage and are processed on write; nothing to watch")
+        return
+    await open_connections()
+    processor = ChangeStreamProcessor(get_database())
+
+    if CHANGE_STREAM_METRICS_PORT:
+        start_http_server(CHANGE_STREAM_METRICS_PORT)
+    event_loop_monitor = asyncio.create_task(monitor_event_loop())
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, processor.stop)
+
+    try:
+        await processor.run()
+    finally:
+        event_loop_monitor.cancel()
+        await close_connections()
+
+if __name__ == "__main__":
+    asyncio.run(main())
\ No newline at end of file
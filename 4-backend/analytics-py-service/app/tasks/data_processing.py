@@ -1,93 +1,234 @@
 import asyncio
+import os
 from datetime import datetime
-from app.config.database import get_sync_database
+from typing import List, Optional
+from app.config.database import get_sync_database, get_async_database
+from app.config.indexes import EVENTS_TTL_DAYS
+from app.config.redis_config import get_redis_client
+from app.services.archive import archiving_enabled
+from app.services.cache import bump_generation
+from app.services.event_store import (
+    event_id_candidates, events_collection, timeseries_storage, to_timeseries_document
+)
+from app.services.metrics import INLINE_PROCESSING_INFLIGHT, observe_processing_lag
+from app.services.rollups import ROLLUPS_COLLECTION, apply_rollups, rollup_operations
 from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 
-def process_data_event(event_id: str):
+PROCESSING_CHUNK_SIZE = int(os.getenv("EVENT_PROCESSING_CHUNK_SIZE", 500))
+PROCESSING_CONCURRENCY = int(os.getenv("EVENT_PROCESSING_CONCURRENCY", 4))
+
+# Fields the classifier and rollups need; everything else stays on the server
+PROCESSING_PROJECTION = {"event_type": 1, "event_data": 1, "user_id": 1, "timestamp": 1}
+
+def classify_event(event: dict) -> dict:
+    """
+    Build the processed_data document for a raw event
+    """
+    processed_data = {
+        "processed_at": datetime.utcnow(),
+        "processing_status": "completed"
+    }
+    
+    if event.get("event_type") == "user_action":
+        processed_data["category"] = "user_behavior"
+    elif event.get("event_type") == "system_event":
+        processed_data["category"] = "system_monitoring"
+    else:
+        processed_data["category"] = "general"
+    
+    event_data = event.get("event_data", {})
+    if isinstance(event_data, dict) and "value" in event_data:
+        try:
+            processed_data["numeric_value"] = float(event_data["value"])
+        except (ValueError, TypeError):
+            pass
+    
+    return processed_data
+
+async def insert_events(db, events: List[dict]):
     """
-    Background task to process data events
-    This can include data enrichment, validation, aggregation, etc.
+    Insert new events into the configured storage, unordered; raises
+    BulkWriteError like insert_many. Time-series measurements can't be updated
+    afterwards, so there events are classified on write and folded into the
+    rollups right away instead of going through the processing queue
     """
+    if not timeseries_storage():
+        await db.events.insert_many(events, ordered=False)
+        return
+    
+    for event in events:
+        event["processed"] = True
+        event["processed_data"] = classify_event(event)
+    
     try:
-        db = get_sync_database()
-        
-        event = db.events.find_one({"_id": ObjectId(event_id)})
-        if not event:
-            print(f"Event {event_id} not found")
-            return
-        
-        processed_data = {
-            "processed_at": datetime.utcnow(),
-            "processing_status": "completed"
-        }
-        
-        if event.get("event_type") == "user_action":
-            processed_data["category"] = "user_behavior"
-        elif event.get("event_type") == "system_event":
-            processed_data["category"] = "system_monitoring"
-        else:
-            processed_data["category"] = "general"
-        
-        event_data = event.get("event_data", {})
-        if isinstance(event_data, dict) and "value" in event_data:
-            try:
-                processed_data["numeric_value"] = float(event_data["value"])
-            except (ValueError, TypeError):
-                pass
-        
-        db.events.update_one(
-            {"_id": ObjectId(event_id)},
-            {
-                "$set": {
-                    "processed": True,
-                    "processed_data": processed_data
-                }
-            }
+        await events_collection(db).insert_many(
+            [to_timeseries_document(event) for event in events], ordered=False
         )
-        
-        print(f"Successfully processed event {event_id}")
-        
-    except Exception as e:
-        print(f"Error processing event {event_id}: {str(e)}")
-        
+    except BulkWriteError as bwe:
+        failed = {error["index"] for error in bwe.details.get("writeErrors", [])}
+        await apply_rollups(db, [event for index, event in enumerate(events) if index not in failed])
+        raise
+    await apply_rollups(db, events)
+
+async def _commit_chunk(db, events: List[dict], semaphore: asyncio.Semaphore) -> int:
+    """
+    Classify a chunk in memory and write all results with one bulk_write,
+    then fold the events this run actually processed into the rollups
+    """
+    run_id = ObjectId()
+    for event in events:
+        event["processed_data"] = classify_event(event)
+        event["processed_data"]["run_id"] = run_id
+    
+    operations = [
+        UpdateOne(
+            {"_id": event["_id"], "processed": False},
+            # rollup_pending stays set until the rollups include the event, so a
+            # failure between the two writes is repaired by reconcile_rollups
+            {"$set": {"processed": True, "rollup_pending": True, "processed_data": event["processed_data"]}}
+        )
+        for event in events
+    ]
+    
+    async with semaphore:
         try:
-            db = get_sync_database()
-            db.events.update_one(
-                {"_id": ObjectId(event_id)},
-                {
-                    "$set": {
-                        "processed": False,
-                        "processing_error": str(e),
+            result = await db.events.bulk_write(operations, ordered=False)
+            modified = result.modified_count
+        except BulkWriteError as bwe:
+            failed = {error["index"] for error in bwe.details.get("writeErrors", [])}
+            print(f"Bulk processing write errors on {len(failed)} of {len(events)} events")
+            if failed:
+                await db.events.update_many(
+                    {"_id": {"$in": [events[index]["_id"] for index in failed]}},
+                    {"$set": {
+                        "processing_error": "bulk write failed",
                         "error_timestamp": datetime.utcnow()
-                    }
-                }
+                    }}
+                )
+            modified = bwe.details.get("nModified", 0)
+        
+        committed = events
+        if modified < len(events):
+            # Another processor got to some of these first; only roll up ours
+            ours = await db.events.distinct(
+                "_id",
+                {"_id": {"$in": [event["_id"] for event in events]}, "processed_data.run_id": run_id}
             )
-        except Exception as update_error:
-            print(f"Failed to update error status for event {event_id}: {str(update_error)}")
+            ours = set(ours)
+            committed = [event for event in events if event["_id"] in ours]
+        
+        await apply_rollups(db, committed)
+        if committed:
+            await db.events.update_many(
+                {"_id": {"$in": [event["_id"] for event in committed]}},
+                {"$unset": {"rollup_pending": ""}}
+            )
+        observe_processing_lag(committed)
+        # Rollups changed, so cached dashboards for these users are stale
+        await bump_generation(get_redis_client(), [event["user_id"] for event in committed])
+        return modified
+
+async def process_events_async(
+    event_ids: Optional[List[str]] = None,
+    limit: Optional[int] = None,
+    chunk_size: int = PROCESSING_CHUNK_SIZE,
+    concurrency: int = PROCESSING_CONCURRENCY,
+    db=None
+) -> int:
+    """
+    Process unprocessed events in chunks read from a single cursor
+    Returns the number of events marked as processed
+    """
+    if db is None:
+        db = await get_async_database()
+    
+    query = {"processed": False}
+    if event_ids is not None:
+        if not event_ids:
+            return 0
+        query["_id"] = {"$in": event_id_candidates(event_ids)}
+    
+    cursor = db.events.find(query, PROCESSING_PROJECTION).batch_size(chunk_size)
+    if limit:
+        cursor = cursor.limit(limit)
+    
+    semaphore = asyncio.Semaphore(concurrency)
+    pending = set()
+    processed = 0
+    chunk = []
+    async for event in cursor:
+        chunk.append(event)
+        if len(chunk) >= chunk_size:
+            # Stop reading while `concurrency` chunks are in flight, so a large
+            # backlog is never held in memory all at once
+            if len(pending) >= concurrency:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                processed += sum(task.result() for task in done)
+            pending.add(asyncio.create_task(_commit_chunk(db, chunk, semaphore)))
+            chunk = []
+    if chunk:
+        pending.add(asyncio.create_task(_commit_chunk(db, chunk, semaphore)))
+    
+    results = await asyncio.gather(*pending)
+    return processed + sum(results)
+
+async def process_event_documents(
+    db,
+    events: List[dict],
+    chunk_size: int = PROCESSING_CHUNK_SIZE,
+    concurrency: int = PROCESSING_CONCURRENCY
+) -> int:
+    """
+    Process events already in hand (e.g. from a change stream) without reading
+    them back; events need the PROCESSING_PROJECTION fields and _id
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    results = await asyncio.gather(*(
+        _commit_chunk(db, events[start:start + chunk_size], semaphore)
+        for start in range(0, len(events), chunk_size)
+    ))
+    return sum(results)
 
-async def batch_process_events():
+async def process_data_events(event_ids: List[str]):
+    """
+    Background task to process a batch of data events in one job
+    """
+    INLINE_PROCESSING_INFLIGHT.inc()
+    try:
+        processed = await process_events_async(event_ids=event_ids)
+        print(f"Successfully processed {processed} of {len(event_ids)} events")
+    except Exception as e:
+        print(f"Error processing event batch: {str(e)}")
+    finally:
+        INLINE_PROCESSING_INFLIGHT.dec()
+
+async def batch_process_events(limit: int = 1000):
     """
     Periodic task to process events in batches
-    This would typically be run by a task scheduler like Celery
+    This would typically be run by a task scheduler like Celery; the change
+    stream processor uses the same polling path only to catch up
     """
     try:
-        db = get_sync_database()
-        
-        unprocessed_events = db.events.find(
-            {"processed": False},
-            {"_id": 1}
-        ).limit(100)
-        
-        for event in unprocessed_events:
-            process_data_event(str(event["_id"]))
-            
+        processed = await process_events_async(limit=limit)
+        print(f"Batch processed {processed} events")
     except Exception as e:
         print(f"Error in batch processing: {str(e)}")
 
 def cleanup_old_events(days_to_keep: int = 30):
     """
     Cleanup task to remove old events
+    Not needed when EVENTS_TTL_DAYS enables the TTL index on events, or when
+    EVENTS_ARCHIVE_DAYS moves them to archive files (app.tasks.archive_events)
     """
+    if EVENTS_TTL_DAYS:
+        print("Skipping cleanup, events expire through the TTL index")
+        return
+    if archiving_enabled():
+        print("Skipping cleanup, expired events are archived by app.tasks.archive_events")
+        return
+    
     try:
         from datetime import timedelta
         
@@ -102,4 +243,4 @@ def cleanup_old_events(days_to_keep: int = 30):
         print(f"Cleaned up {result.deleted_count} old events")
         
     except Exception as e:
-        print(f"Error in cleanup task: {str(e)}")
\ No newline at end of file
+        print(f"Error in cleanup task: {str(e)}")
@@ -0,0 +1,35 @@
+"""
+Report missing and unused MongoDB indexes using $indexStats
+
+    python -m app.tasks.index_report [--ensure]
+"""
+import argparse
+import asyncio
+import json
+import logging
+from dotenv import load_dotenv
+
+# Before the app imports: their module-level settings read the environment
+load_dotenv()
+
+from app.config.connections import open_connections, close_connections
+from app.config.database import get_database
+from app.config.indexes import ensure_indexes, index_report
+
+async def main(ensure: bool = False):
+    await open_connections(use_redis=False)
+    db = get_database()
+    try:
+        if ensure:
+            await ensure_indexes(db)
+        report = await index_report(db)
+        print(json.dumps(report, indent=2, default=str))
+    finally:
+        await close_connections()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Report missing and unused indexes")
+    parser.add_argument("--ensure", action="store_true", help="Create missing indexes before reporting")
+    args = parser.parse_args()
+    asyncio.run(main(args.ensure))
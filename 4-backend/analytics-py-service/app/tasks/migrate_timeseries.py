@@ -0,0 +1,106 @@
+"""
+Copy events from the `events` collection into the time-series collection
+
+    python -m app.tasks.migrate_timeseries [--batch-size 1000] [--restart]
+
+Resumable: progress is checkpointed after every batch, so re-running continues
+where the last run stopped (a batch interrupted before its checkpoint is copied
+again; time-series collections cannot reject the duplicates).
+
+Typical rollout: run once while the API still uses EVENTS_STORAGE=collection,
+switch the API to EVENTS_STORAGE=timeseries, then run again to copy the tail
+written in between. The source collection is left in
+place; drop it once the counts below match, allowing for events that already
+aged out of the time-series retention window.
+"""
+import argparse
+import asyncio
+import logging
+from datetime import datetime
+from dotenv import load_dotenv
+
+# Before the app imports: their module-level settings read the environment
+load_dotenv()
+
+from app.config.connections import open_connections, close_connections
+from app.config.database import get_database
+from app.services.event_store import (
+    EVENTS_TIMESERIES_COLLECTION, ensure_timeseries_collection, to_timeseries_document
+)
+from app.tasks.data_processing import process_events_async
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_COLLECTION = "migrations"
+MIGRATION_ID = "events_to_timeseries"
+
+def _after(last_id) -> dict:
+    if last_id is None:
+        return {}
+    # BSON orders strings before ObjectIds, and $gt only compares within a type
+    if isinstance(last_id, str):
+        return {"$or": [{"_id": {"$gt": last_id}}, {"_id": {"$type": "objectId"}}]}
+    return {"_id": {"$gt": last_id}}
+
+async def _settle_unprocessed(db, batch: list) -> list:
+    """
+    Run stragglers through the normal processing path first, so their rollup
+    increments are applied exactly once, then re-read them classified
+    """
+    pending = [event["_id"] for event in batch if not event.get("processed")]
+    if not pending:
+        return batch
+    await process_events_async(event_ids=[str(event_id) for event_id in pending], db=db)
+    fresh = {event["_id"]: event async for event in db.events.find({"_id": {"$in": pending}})}
+    return [fresh.get(event["_id"], event) for event in batch]
+
+async def migrate(db, batch_size: int = 1000, restart: bool = False) -> dict:
+    await ensure_timeseries_collection(db)
+    target = db[EVENTS_TIMESERIES_COLLECTION]
+    checkpoints = db[MIGRATIONS_COLLECTION]
+
+    if restart:
+        await checkpoints.delete_one({"_id": MIGRATION_ID})
+    checkpoint = await checkpoints.find_one({"_id": MIGRATION_ID}) or {}
+    last_id = checkpoint.get("last_id")
+    copied = checkpoint.get("copied", 0)
+    if last_id is not None:
+        logger.info(f"Resuming after {last_id} ({copied} events already copied)")
+
+    while True:
+        batch = await db.events.find(_after(last_id)).sort("_id", 1).limit(batch_size).to_list(length=batch_size)
+        if not batch:
+            break
+        batch = await _settle_unprocessed(db, batch)
+        await target.insert_many([to_timeseries_document(event) for event in batch], ordered=False)
+
+        last_id = batch[-1]["_id"]
+        copied += len(batch)
+        await checkpoints.update_one(
+            {"_id": MIGRATION_ID},
+            {"$set": {"last_id": last_id, "copied": copied, "updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+        logger.info(f"Copied {copied} events (last _id {last_id})")
+
+    source_count = await db.events.count_documents({})
+    target_count = await target.count_documents({})
+    return {"copied": copied, "source_count": source_count, "target_count": target_count}
+
+async def main(batch_size: int, restart: bool):
+    await open_connections(use_redis=False)
+    db = get_database()
+    try:
+        result = await migrate(db, batch_size=batch_size, restart=restart)
+        print(f"Copied {result['copied']} events; events={result['source_count']} "
+              f"{EVENTS_TIMESERIES_COLLECTION}={result['target_count']}")
+    finally:
+        await close_connections()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Copy events into the time-series collection")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and copy from the beginning")
+    args = parser.parse_args()
+    asyncio.run(main(args.batch_size, args.restart))
\ No newline at end of file
@@ -0,0 +1,147 @@
+"""
+Standalone event processing worker
+
+Consumes the data events stream through a Redis consumer group so processing
+can be scaled out across processes and nodes:
+
+    EVENT_PROCESSING_MODE=worker python -m app.tasks.worker
+"""
+import asyncio
+import os
+import signal
+import socket
+import logging
+from dotenv import load_dotenv
+from prometheus_client import start_http_server
+from redis.exceptions import ResponseError
+
+# Before the app imports: their module-level settings read the environment
+load_dotenv()
+
+from app.config.connections import open_connections, close_connections
+from app.config.database import get_database
+from app.config.redis_config import get_redis_client
+from app.services.cache import bump_generation
+from app.services.event_queue import DATA_EVENTS_STREAM, DATA_EVENTS_GROUP
+from app.services.metrics import monitor_event_loop, monitor_event_queue
+from app.services.rollups import reconcile_rollups
+from app.tasks.data_processing import process_events_async
+
+logger = logging.getLogger(__name__)
+
+WORKER_BATCH_SIZE = int(os.getenv("WORKER_BATCH_SIZE", 200))
+WORKER_BLOCK_MS = int(os.getenv("WORKER_BLOCK_MS", 5000))
+# Messages pending longer than this on a dead consumer are reclaimed
+WORKER_CLAIM_IDLE_MS = int(os.getenv("WORKER_CLAIM_IDLE_MS", 60000))
+WORKER_CLAIM_INTERVAL_S = int(os.getenv("WORKER_CLAIM_INTERVAL_S", 30))
+# Prometheus scrape port for the worker process; 0 disables it
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", 9101))
+
+class EventStreamWorker:
+    """Redis Streams消费者，批量处理事件并批量确认"""
+
+    def __init__(self, redis_client, db, consumer_name: str = None):
+        self.redis = redis_client
+        self.db = db
+        self.consumer_name = consumer_name or f"{socket.gethostname()}-{os.getpid()}"
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    async def ensure_group(self):
+        try:
+            await self.redis.xgroup_create(DATA_EVENTS_STREAM, DATA_EVENTS_GROUP, id="0", mkstream=True)
+            logger.info(f"Created consumer group {DATA_EVENTS_GROUP} on {DATA_EVENTS_STREAM}")
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def handle(self, messages) -> int:
+        """Process a batch of stream messages and XACK them in one call"""
+        if not messages:
+            return 0
+
+        message_ids = [message_id for message_id, _ in messages]
+        event_ids = [fields["event_id"] for _, fields in messages if fields and "event_id" in fields]
+
+        # Only acknowledge once the results are committed; on failure the
+        # messages stay pending and are reclaimed later
+        await process_events_async(event_ids=event_ids, db=self.db)
+        await self.redis.xack(DATA_EVENTS_STREAM, DATA_EVENTS_GROUP, *message_ids)
+        return len(message_ids)
+
+    async def reclaim(self) -> int:
+        """Take over messages left pending by crashed or stuck consumers"""
+        reclaimed = 0
+        start_id = "0-0"
+        while True:
+            result = await self.redis.xautoclaim(
+                DATA_EVENTS_STREAM, DATA_EVENTS_GROUP, self.consumer_name,
+                min_idle_time=WORKER_CLAIM_IDLE_MS, start_id=start_id, count=WORKER_BATCH_SIZE
+            )
+            start_id, messages = result[0], result[1]
+            # Entries trimmed from the stream come back as empty payloads
+            live = [(message_id, fields) for message_id, fields in messages if fields]
+            dead = [message_id for message_id, fields in messages if not fields]
+            if dead:
+                await self.redis.xack(DATA_EVENTS_STREAM, DATA_EVENTS_GROUP, *dead)
+            reclaimed += await self.handle(live)
+            if start_id in ("0-0", b"0-0") or not messages:
+                return reclaimed
+
+    async def run(self):
+        await self.ensure_group()
+        logger.info(f"Worker {self.consumer_name} consuming {DATA_EVENTS_STREAM}")
+
+        loop = asyncio.get_running_loop()
+        next_claim = 0.0
+        while not self._stopping.is_set():
+            try:
+                if loop.time() >= next_claim:
+                    reclaimed = await self.reclaim()
+                    if reclaimed:
+                        logger.info(f"Reclaimed {reclaimed} pending events")
+                    # Repair rollups left short by chunks whose rollup write failed
+                    reconciled = await reconcile_rollups(self.db)
+                    await bump_generation(self.redis, reconciled)
+                    next_claim = loop.time() + WORKER_CLAIM_INTERVAL_S
+
+                response = await self.redis.xreadgroup(
+                    DATA_EVENTS_GROUP, self.consumer_name,
+                    {DATA_EVENTS_STREAM: ">"},
+                    count=WORKER_BATCH_SIZE, block=WORKER_BLOCK_MS
+                )
+                for _, messages in response or []:
+                    await self.handle(messages)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in event worker loop: {e}")
+                await asyncio.sleep(1)
+
+async def main():
+    logging.basicConfig(level=logging.INFO)
+    await open_connections()
+    worker = EventStreamWorker(get_redis_client(), get_database())
+    
+    if WORKER_METRICS_PORT:
+        start_http_server(WORKER_METRICS_PORT)
+    monitors = [
+        asyncio.create_task(monitor_event_loop()),
+        asyncio.create_task(monitor_event_queue(get_redis_client(), DATA_EVENTS_STREAM, DATA_EVENTS_GROUP))
+    ]
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+
+    try:
+        await worker.run()
+    finally:
+        for monitor in monitors:
+            monitor.cancel()
+        await close_connections()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,93 @@
+"""
+Per-request authentication cost: legacy decode vs token cache vs Kong headers
+
+    python -m benchmarks.bench_auth [--calls 20000] [--repeat 5] [--tokens 100]
+
+Legacy path = read JWT_SECRET from the environment, python-jose HS256 decode and
+a TokenData per call (what verify_jwt_token did before the cache).
+"""
+import argparse
+import json
+import os
+import time
+
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from jose import jwt
+from starlette.requests import Request
+
+from app.middleware import auth
+from app.middleware.auth import TokenData, get_jwt_secret, token_cache, verify_jwt_token
+from app.middleware.trust_kong import UserContext
+
+def make_tokens(count: int) -> list:
+    exp = int(time.time()) + 3600
+    return [
+        jwt.encode({"userId": f"user-{i}", "username": f"user-{i}", "exp": exp}, get_jwt_secret(), algorithm="HS256")
+        for i in range(count)
+    ]
+
+def legacy_verify(token: str) -> TokenData:
+    payload = jwt.decode(token, os.getenv("JWT_SECRET", "jwt-secret"), algorithms=["HS256"])
+    if payload.get("userId") is None:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return TokenData(user_id=payload.get("userId"), username=payload.get("username"))
+
+def make_request(user_id: str = None) -> Request:
+    headers = []
+    if user_id:
+        headers = [(b"x-user-id", user_id.encode()), (b"x-user-role", b"student"), (b"x-user-name", b"bench")]
+    request = Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+    request.state.user = UserContext(request)
+    return request
+
+def measure(fn, calls: int, repeat: int) -> float:
+    """Best per-call wall time in microseconds over `repeat` runs"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for i in range(calls):
+            fn(i)
+        best = min(best, time.perf_counter() - start)
+    return round(best / calls * 1e6, 3)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--tokens", type=int, default=100, help="Distinct tokens cycled through")
+    args = parser.parse_args()
+
+    tokens = make_tokens(args.tokens)
+    credentials = [HTTPAuthorizationCredentials(scheme="Bearer", credentials=token) for token in tokens]
+    anonymous = make_request()
+    kong_request = make_request("user-0")
+
+    auth.AUTH_MODE = "jwt"
+    legacy_us = measure(lambda i: legacy_verify(tokens[i % len(tokens)]), args.calls, args.repeat)
+
+    def uncached(i):
+        token_cache.clear()
+        verify_jwt_token(anonymous, credentials[i % len(credentials)])
+
+    uncached_us = measure(uncached, args.calls, args.repeat)
+    token_cache.clear()
+    cached_us = measure(lambda i: verify_jwt_token(anonymous, credentials[i % len(credentials)]), args.calls, args.repeat)
+
+    auth.AUTH_MODE = "kong"
+    kong_us = measure(lambda i: verify_jwt_token(kong_request, None), args.calls, args.repeat)
+
+    print(json.dumps({
+        "benchmark": "auth",
+        "calls": args.calls,
+        "tokens": args.tokens,
+        "legacy_us_per_call": legacy_us,
+        "uncached_us_per_call": uncached_us,
+        "cached_us_per_call": cached_us,
+        "kong_headers_us_per_call": kong_us,
+        "cache_speedup": round(legacy_us / cached_us, 2) if cached_us else None,
+        "kong_speedup": round(legacy_us / kong_us, 2) if kong_us else None
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
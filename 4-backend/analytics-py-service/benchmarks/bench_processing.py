@@ -0,0 +1,129 @@
+"""
+Micro-benchmarks for event validation and processing
+
+    python -m benchmarks.bench_processing [--events 2000] [--repeat 5]
+        [--mongo auto|mongod|mongomock] [--output results.json]
+
+- validate_*: pydantic model construction per event, no I/O
+- classify_event: the in-memory part of processing
+- process_events_async: the chunked bulk path, reported per event
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from app.models.data_models import CreateDataEventRequest, DataEvent
+from app.services.rollups import ROLLUPS_COLLECTION
+from app.tasks.data_processing import classify_event, process_events_async
+from benchmarks.harness import emit, local_backends, run_metadata, skip
+
+EVENT_TYPES = ["user_action", "system_event", "page_view"]
+
+def make_raw_events(count: int, user_id: str = "bench-user") -> list:
+    now = datetime.utcnow()
+    return [
+        {
+            "_id": ObjectId(),
+            "event_type": EVENT_TYPES[i % len(EVENT_TYPES)],
+            "event_data": {"value": random.random() * 100, "page": f"/course/{i % 50}"},
+            "user_id": user_id,
+            "timestamp": now - timedelta(seconds=i),
+            "metadata": {"source": "benchmark"},
+            "processed": False
+        }
+        for i in range(count)
+    ]
+
+def per_event_us(fn, count: int, repeat: int, setup=None) -> float:
+    """Best wall time per event in microseconds over `repeat` runs; setup is untimed"""
+    best = float("inf")
+    for _ in range(repeat):
+        state = setup() if setup else None
+        start = time.perf_counter()
+        fn(state)
+        best = min(best, time.perf_counter() - start)
+    return round(best / count * 1e6, 3)
+
+def bench_validation(count: int, repeat: int) -> dict:
+    payloads = [
+        {"event_type": event["event_type"], "event_data": event["event_data"], "metadata": event["metadata"]}
+        for event in make_raw_events(count)
+    ]
+
+    def validate_request(_):
+        for payload in payloads:
+            CreateDataEventRequest(**payload)
+
+    def validate_data_event(_):
+        for payload in payloads:
+            DataEvent(user_id="bench-user", **payload).dict(by_alias=True)
+
+    return {
+        "validate_create_request_us": per_event_us(validate_request, count, repeat),
+        "validate_data_event_us": per_event_us(validate_data_event, count, repeat)
+    }
+
+def bench_classify(count: int, repeat: int) -> dict:
+    events = make_raw_events(count)
+
+    def classify(_):
+        for event in events:
+            classify_event(event)
+
+    return {"classify_event_us": per_event_us(classify, count, repeat)}
+
+async def bench_process_events_async(db, count: int, repeat: int) -> dict:
+    best = float("inf")
+    processed = 0
+    for _ in range(repeat):
+        await db.events.delete_many({})
+        await db[ROLLUPS_COLLECTION].delete_many({})
+        await db.events.insert_many(make_raw_events(count))
+        start = time.perf_counter()
+        processed = await process_events_async(db=db)
+        best = min(best, time.perf_counter() - start)
+    return {
+        "process_events_async_us": round(best / count * 1e6, 3),
+        "process_events_async_processed": processed
+    }
+
+async def run(args) -> dict:
+    random.seed(args.seed)
+    results = {}
+    results.update(bench_validation(args.events, args.repeat))
+    results.update(bench_classify(args.events, args.repeat))
+
+    skipped = {}
+    async with local_backends(args.mongo) as backends:
+        # mongomock-motor cursors are not async-iterable, so the bulk path cannot run there
+        if backends.mongo == "mongod":
+            results.update(await bench_process_events_async(backends.db, args.events, args.repeat))
+        else:
+            skip("process_events_async", f"needs a real mongod, got {backends.mongo}", skipped)
+
+    return {
+        "benchmark": "processing",
+        "meta": run_metadata(),
+        "backends": backends.describe(),
+        "params": {"events": args.events, "repeat": args.repeat, "seed": args.seed},
+        "results": results,
+        "skipped": skipped
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--mongo", choices=["auto", "mongod", "mongomock"], default="auto")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Also write the JSON results to this file")
+    args = parser.parse_args()
+
+    emit(asyncio.run(run(args)), args.output)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
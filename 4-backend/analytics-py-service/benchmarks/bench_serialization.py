@@ -0,0 +1,73 @@
+"""
+Per-event serialization cost: legacy path vs BSONJSONResponse
+
+    python -m benchmarks.bench_serialization [--events 1000] [--repeat 20]
+
+Legacy path = stringify _id in a Python loop, jsonable_encoder, stdlib json
+(what FastAPI does for response_model=dict routes).
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+
+from app.services.fast_json import BSONJSONResponse, orjson
+
+def make_events(count: int) -> list:
+    now = datetime.utcnow()
+    return [
+        {
+            "_id": ObjectId(),
+            "event_type": random.choice(["user_action", "system_event", "page_view"]),
+            "event_data": {"value": random.random() * 100, "page": f"/course/{i % 50}", "tags": ["a", "b"]},
+            "user_id": f"user-{i % 20}",
+            "timestamp": now - timedelta(seconds=i),
+            "metadata": {"ua": "Mozilla/5.0", "ip": "10.0.0.1"},
+            "processed": True,
+            "processed_data": {"category": "user_behavior", "numeric_value": 42.0, "processed_at": now}
+        }
+        for i in range(count)
+    ]
+
+def legacy(events: list) -> bytes:
+    for event in events:
+        event["_id"] = str(event["_id"])
+    body = jsonable_encoder({"success": True, "events": events})
+    return json.dumps(body, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+def fast(events: list) -> bytes:
+    return BSONJSONResponse({"success": True, "events": events}).body
+
+def measure(fn, count: int, repeat: int) -> float:
+    """Best per-event CPU time in microseconds over `repeat` runs"""
+    best = float("inf")
+    for _ in range(repeat):
+        events = make_events(count)
+        start = time.process_time()
+        fn(events)
+        best = min(best, time.process_time() - start)
+    return best / count * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    legacy_us = measure(legacy, args.events, args.repeat)
+    fast_us = measure(fast, args.events, args.repeat)
+    print(json.dumps({
+        "benchmark": "serialization",
+        "events": args.events,
+        "encoder": "orjson" if orjson else "json",
+        "legacy_us_per_event": round(legacy_us, 3),
+        "fast_us_per_event": round(fast_us, 3),
+        "speedup": round(legacy_us / fast_us, 2) if fast_us else None
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Diff two benchmark result files (e.g. from two commits)
+
+    python -m benchmarks.compare base.json head.json [--threshold 10]
+
+Prints every numeric metric present in both files with its relative change and
+flags changes beyond the threshold. Higher is better for *_rps, lower is
+better for latencies and per-event times.
+"""
+import argparse
+import json
+import sys
+from typing import Dict
+
+# Bookkeeping values that are not performance measurements
+IGNORED_KEYS = ("meta", "params", "backends")
+
+def flatten(results: dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        if not prefix and key in IGNORED_KEYS:
+            continue
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{path}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+def higher_is_better(metric: str) -> bool:
+    return metric.endswith(("_rps", "speedup", "_processed"))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Percent change to flag")
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+    if base.get("backends") != head.get("backends"):
+        print(f"warning: backends differ: {base.get('backends')} vs {head.get('backends')}", file=sys.stderr)
+
+    base_metrics = flatten(base)
+    head_metrics = flatten(head)
+    regressions = 0
+    print(f"{'metric':<55} {'base':>12} {'head':>12} {'change':>9}")
+    for metric in sorted(base_metrics.keys() & head_metrics.keys()):
+        before, after = base_metrics[metric], head_metrics[metric]
+        change = (after - before) / before * 100 if before else 0.0
+        worse = change < 0 if higher_is_better(metric) else change > 0
+        flag = ""
+        if abs(change) >= args.threshold and not metric.endswith((".requests", ".errors", ".events")):
+            flag = " regressed" if worse else " improved"
+            regressions += worse
+        print(f"{metric:<55} {before:>12} {after:>12} {change:>+8.1f}%{flag}")
+
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,183 @@
+"""
+Local stand-ins for the service's backends, shared by the benchmark scripts
+
+- MongoDB: a throwaway `mongod` when the binary is on PATH, else mongomock-motor
+  (in-memory; no async cursors and no $facet/$dateTrunc/$sortArray, so anything
+  measured through those is marked as needing mongod and skipped with a warning)
+- Redis: fakeredis
+- business-service: an in-process grpc.aio CampusService with canned responses
+"""
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
+
+import grpc
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import MongoClient
+
+from app.config.database import DATABASE_NAME, MONGO_CLIENT_OPTIONS, close_mongo_connection, mongodb
+from app.config.indexes import ensure_indexes
+from app.config.redis_config import redis_client
+from app.proto import campus_pb2, campus_pb2_grpc
+from app.services.grpc_client import grpc_client
+
+MONGOD_START_TIMEOUT = 20
+
+class FakeCampusService(campus_pb2_grpc.CampusServiceServicer):
+    """Canned business-service responses so gRPC latency is only transport + client overhead"""
+
+    async def GetStats(self, request, context):
+        return campus_pb2.GetStatsResponse(
+            success=True,
+            stats={"total": 1200, "active": 860, "new": 42}
+        )
+
+    async def GetCourses(self, request, context):
+        courses = [
+            campus_pb2.Course(id=i, name=f"Course {i}")
+            for i in range(1, (request.limit or 20) + 1)
+        ]
+        return campus_pb2.GetCoursesResponse(success=True, courses=courses, total=len(courses))
+
+class Backends:
+    def __init__(self):
+        self.mongo: Optional[str] = None
+        self.redis: Optional[str] = None
+        self.grpc = "fake"
+        self.db = None
+
+    def describe(self) -> Dict[str, str]:
+        return {"mongo": self.mongo, "redis": self.redis, "grpc": self.grpc}
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _start_mongod(dbpath: str) -> Tuple[subprocess.Popen, str]:
+    port = _free_port()
+    process = subprocess.Popen(
+        ["mongod", "--dbpath", dbpath, "--bind_ip", "127.0.0.1", "--port", str(port), "--quiet"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    url = f"mongodb://127.0.0.1:{port}"
+    deadline = time.monotonic() + MONGOD_START_TIMEOUT
+    while True:
+        try:
+            with MongoClient(url, serverSelectionTimeoutMS=500) as probe:
+                probe.admin.command("ping")
+            return process, url
+        except Exception:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError("mongod did not start")
+            time.sleep(0.2)
+
+@asynccontextmanager
+async def local_backends(mongo: str = "auto"):
+    """
+    Point the app's shared clients at local stand-ins; the app lifespan is not
+    run, so nothing here ever touches the configured MONGODB_URL/REDIS_URL
+    """
+    backends = Backends()
+    mongod = None
+    dbpath = None
+
+    if mongo == "mongod" or (mongo == "auto" and shutil.which("mongod")):
+        dbpath = tempfile.mkdtemp(prefix="analytics-bench-")
+        mongod, url = _start_mongod(dbpath)
+        mongodb.client = AsyncIOMotorClient(url, **MONGO_CLIENT_OPTIONS)
+        mongodb.sync_client = MongoClient(url, **MONGO_CLIENT_OPTIONS)
+        backends.mongo = "mongod"
+    else:
+        import mongomock
+        from mongomock_motor import AsyncMongoMockClient
+        # Note: the mock sync and async clients do not share data
+        mongodb.client = AsyncMongoMockClient()
+        mongodb.sync_client = mongomock.MongoClient()
+        backends.mongo = "mongomock"
+    mongodb.database = mongodb.client[DATABASE_NAME]
+    backends.db = mongodb.database
+    if backends.mongo == "mongod":
+        await ensure_indexes(backends.db)
+
+    import fakeredis.aioredis
+    redis_client.client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    backends.redis = "fakeredis"
+
+    grpc_server = grpc.aio.server()
+    campus_pb2_grpc.add_CampusServiceServicer_to_server(FakeCampusService(), grpc_server)
+    port = grpc_server.add_insecure_port("127.0.0.1:0")
+    await grpc_server.start()
+    grpc_client.business_service_url = f"127.0.0.1:{port}"
+    await grpc_client.connect()
+
+    try:
+        yield backends
+    finally:
+        await grpc_client.close()
+        await grpc_server.stop(None)
+        await redis_client.client.close()
+        redis_client.client = None
+        await close_mongo_connection()
+        if mongod:
+            mongod.terminate()
+            mongod.wait()
+        if dbpath:
+            shutil.rmtree(dbpath, ignore_errors=True)
+
+def skip(name: str, reason: str, skipped: Dict[str, str]):
+    """Record a benchmark that did not run and say so on stderr, so it is never mistaken for a result"""
+    skipped[name] = reason
+    print(f"WARNING: skipping {name}: {reason}", file=sys.stderr)
+
+def percentile(sorted_values: List[float], rank: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(rank / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def summarize(latencies: List[float], elapsed: float, errors: int = 0) -> dict:
+    """Latencies in seconds -> throughput and p50/p99 in milliseconds"""
+    ordered = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3) if ordered else 0.0
+    }
+
+def run_metadata() -> dict:
+    """Enough context to tell two result files apart when diffing them"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    }
+
+def emit(results: dict, output: Optional[str] = None):
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    print(text)
\ No newline at end of file
@@ -0,0 +1,271 @@
+"""
+Throughput and latency of the HTTP routes against local backend stand-ins
+
+    python -m benchmarks.load_test [--users 20] [--events-per-user 500]
+        [--requests 500] [--concurrency 32] [--mongo auto|mongod|mongomock]
+        [--processing worker|inline] [--ingest direct|buffered] [--scenarios ingest,paging,...]
+        [--output results.json]
+
+Requests go through the real ASGI app in-process (httpx ASGITransport), so the
+numbers cover routing, auth, validation, Mongo/Redis round trips and
+serialization, but not a network hop or uvicorn. With --processing inline the
+ingest latency includes the background processing task, because the transport
+waits for the whole ASGI call.
+
+Rollup, pipeline and streaming-export scenarios need a real mongod; on
+mongomock they are skipped with a warning and listed under "skipped".
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+from bson import ObjectId
+from jose import jwt
+
+from app.main import app
+from app.middleware.auth import get_jwt_secret
+from app.config.redis_config import get_redis_client
+from app.services import event_queue, ingest_buffer
+from app.services.cache import bump_generation
+from app.services.grpc_client import grpc_client
+from app.tasks.data_processing import process_events_async
+from benchmarks.harness import emit, local_backends, run_metadata, skip, summarize
+
+EVENT_TYPES = ["user_action", "system_event", "page_view", "api_call"]
+
+class Scenario:
+    """
+    One measured operation. `prepare` runs untimed before each request (cursor
+    lookup, cache busting); only `send` is on the clock
+    """
+
+    def __init__(self, name: str, send: Callable[..., Awaitable],
+                 prepare: Optional[Callable[[int], Awaitable]] = None,
+                 on_result: Optional[Callable] = None,
+                 requires_mongod: bool = False):
+        self.name = name
+        self.send = send
+        self.prepare = prepare
+        self.on_result = on_result
+        # Rollups, $facet/$sortArray pipelines or async cursors: meaningless on mongomock
+        self.requires_mongod = requires_mongod
+
+def make_token(user_id: str) -> str:
+    return jwt.encode({"userId": user_id, "username": user_id}, get_jwt_secret(), algorithm="HS256")
+
+def make_event_payload(i: int) -> dict:
+    return {
+        "event_type": EVENT_TYPES[i % len(EVENT_TYPES)],
+        "event_data": {"value": random.random() * 100, "page": f"/course/{i % 50}"},
+        "metadata": {"source": "benchmark"}
+    }
+
+async def seed(db, users: List[str], events_per_user: int, process: bool = True) -> dict:
+    """
+    Insert events spread over the last 14 days, then process them into rollups.
+    Raises if processing fails: every rollup-backed scenario would measure an empty collection
+    """
+    now = datetime.utcnow()
+    start = time.perf_counter()
+    for user_id in users:
+        docs = []
+        for i in range(events_per_user):
+            payload = make_event_payload(i)
+            docs.append({
+                "_id": str(ObjectId()),
+                "event_type": payload["event_type"],
+                "event_data": payload["event_data"],
+                "user_id": user_id,
+                "timestamp": now - timedelta(seconds=random.randint(0, 14 * 86400)),
+                "metadata": payload["metadata"],
+                "processed": False
+            })
+        await db.events.insert_many(docs, ordered=False)
+    inserted = time.perf_counter() - start
+
+    processing = "skipped"
+    if process:
+        try:
+            await process_events_async(db=db)
+        except Exception as e:
+            raise RuntimeError(f"Seeding failed while processing events: {type(e).__name__}: {e}") from e
+        processing = "ok"
+    return {
+        "events": len(users) * events_per_user,
+        "insert_seconds": round(inserted, 3),
+        "total_seconds": round(time.perf_counter() - start, 3),
+        "processing": processing
+    }
+
+def build_scenarios(client: httpx.AsyncClient, users: List[str]) -> Dict[str, Scenario]:
+    headers = {user_id: {"Authorization": f"Bearer {make_token(user_id)}"} for user_id in users}
+    cursors: Dict[str, Optional[str]] = {}
+
+    def user_for(i: int) -> str:
+        return users[i % len(users)]
+
+    async def ingest(i):
+        return await client.post("/api/data/events", json=make_event_payload(i), headers=headers[user_for(i)])
+
+    async def paging(i):
+        user_id = user_for(i)
+        params = {"limit": 50}
+        if cursors.get(user_id):
+            params["cursor"] = cursors[user_id]
+        return user_id, await client.get("/api/data/events", params=params, headers=headers[user_id])
+
+    def follow_cursor(result):
+        # Walk each user's pages in order, starting over at the end
+        user_id, response = result
+        if response.status_code == 200:
+            cursors[user_id] = response.json().get("next_cursor")
+
+    async def dashboard(i):
+        return await client.get("/api/analytics/dashboard", headers=headers[user_for(i)])
+
+    async def bust_cache(i):
+        await bump_generation(get_redis_client(), [user_for(i)])
+
+    def query(body: dict):
+        async def send(i):
+            return await client.post("/api/analytics/query", json=body, headers=headers[user_for(i)])
+        return send
+
+    async def export_json(i):
+        return await client.get("/api/analytics/export", params={"limit": 500}, headers=headers[user_for(i)])
+
+    async def export_stream(i):
+        return await client.get(
+            "/api/analytics/export",
+            params={"stream": "true", "format": "ndjson"},
+            headers=headers[user_for(i)]
+        )
+
+    async def grpc_stats(i):
+        return await grpc_client.get_stats("user", period="daily")
+
+    return {scenario.name: scenario for scenario in [
+        Scenario("ingest", ingest),
+        Scenario("paging", paging, on_result=follow_cursor),
+        Scenario("dashboard_cached", dashboard, requires_mongod=True),
+        Scenario("dashboard_cold", dashboard, prepare=bust_cache, requires_mongod=True),
+        Scenario("query_count_by_type", query({"group_by": "event_type"}), prepare=bust_cache,
+                 requires_mongod=True),
+        Scenario("query_avg_by_day", query({"aggregation": "avg", "bucket": "day"}), prepare=bust_cache,
+                 requires_mongod=True),
+        Scenario("query_p95_raw", query({"aggregation": "percentile", "percentile": 95}), prepare=bust_cache,
+                 requires_mongod=True),
+        Scenario("export_json", export_json),
+        Scenario("export_stream", export_stream, requires_mongod=True),
+        Scenario("grpc_get_stats", grpc_stats),
+    ]}
+
+def _error_of(result) -> Optional[str]:
+    response = result[1] if isinstance(result, tuple) else result
+    if isinstance(response, httpx.Response) and response.status_code >= 400:
+        return f"{response.status_code}: {response.text[:200]}"
+    return None
+
+async def run_scenario(scenario: Scenario, requests: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors: List[str] = []
+
+    async def one(i: int):
+        async with semaphore:
+            if scenario.prepare:
+                await scenario.prepare(i)
+            start = time.perf_counter()
+            try:
+                result = await scenario.send(i)
+            except Exception as e:
+                latencies.append(time.perf_counter() - start)
+                errors.append(f"{type(e).__name__}: {e}")
+                return
+            latencies.append(time.perf_counter() - start)
+            error = _error_of(result)
+            if error:
+                errors.append(error)
+            elif scenario.on_result:
+                scenario.on_result(result)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    summary = summarize(latencies, time.perf_counter() - start, len(errors))
+    if errors:
+        summary["first_error"] = errors[0]
+    return summary
+
+async def run(args) -> dict:
+    random.seed(args.seed)
+    event_queue.EVENT_PROCESSING_MODE = args.processing
+    ingest_buffer.INGEST_MODE = args.ingest
+    users = [f"bench-user-{i}" for i in range(args.users)]
+
+    async with local_backends(args.mongo) as backends:
+        real_mongo = backends.mongo == "mongod"
+        try:
+            seeded = await seed(backends.db, users, args.events_per_user, process=real_mongo)
+        except RuntimeError as e:
+            raise SystemExit(str(e))
+        if ingest_buffer.buffered_ingestion():
+            ingest_buffer.ingest_buffer.start(backends.db, get_redis_client())
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            scenarios = build_scenarios(client, users)
+            selected = args.scenarios.split(",") if args.scenarios else list(scenarios)
+            unknown = [name for name in selected if name not in scenarios]
+            if unknown:
+                raise SystemExit(f"Unknown scenarios {unknown}. Available: {list(scenarios)}")
+
+            results = {}
+            skipped = {}
+            for name in selected:
+                if scenarios[name].requires_mongod and not real_mongo:
+                    skip(name, f"needs a real mongod, got {backends.mongo}", skipped)
+                    continue
+                # Warm up connection pools and caches outside the measurement
+                await run_scenario(scenarios[name], min(args.concurrency, args.requests), args.concurrency)
+                results[name] = await run_scenario(scenarios[name], args.requests, args.concurrency)
+        await ingest_buffer.ingest_buffer.stop()
+
+        return {
+            "benchmark": "load_test",
+            "meta": run_metadata(),
+            "backends": backends.describe(),
+            "params": {
+                "users": args.users,
+                "events_per_user": args.events_per_user,
+                "requests": args.requests,
+                "concurrency": args.concurrency,
+                "processing": args.processing,
+                "ingest": args.ingest,
+                "seed": args.seed
+            },
+            "seeding": seeded,
+            "scenarios": results,
+            "skipped": skipped
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--events-per-user", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--mongo", choices=["auto", "mongod", "mongomock"], default="auto")
+    parser.add_argument("--processing", choices=["worker", "inline"], default="worker")
+    parser.add_argument("--ingest", choices=["direct", "buffered"], default="direct")
+    parser.add_argument("--scenarios", help="Comma-separated subset of scenarios to run")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Also write the JSON results to this file")
+    args = parser.parse_args()
+
+    emit(asyncio.run(run(args)), args.output)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file